@@ -30,6 +30,8 @@ class HuffmanTree:
     left: left subtree of this Huffman tree
     right: right subtree of this Huffman tree
     """
+    # no __dict__ per node, which matters once there are many trees
+    __slots__ = ['symbol', 'number', 'left', 'right']
     symbol: Optional[int]
     number: Optional[int]
     left: Optional[HuffmanTree]
@@ -55,10 +57,20 @@ class HuffmanTree:
         >>> a == b
         False
         """
-        return (isinstance(self, type(other))
-                and self.symbol == other.symbol
-                and self.left == other.left
-                and self.right == other.right)
+        # compare the pairs of nodes with a stack instead of recursion, so
+        # deep trees cannot hit the recursion limit
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is None or b is None:
+                if a is not b:
+                    return False
+            elif not (isinstance(a, type(b)) and a.symbol == b.symbol):
+                return False
+            else:
+                stack.append((a.left, b.left))
+                stack.append((a.right, b.right))
+        return True
 
     def __lt__(self, other: Any) -> bool:
         """ Return True iff this HuffmanTree is less than <other>."""
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import os
+import tempfile
 from random import shuffle
 
 import pytest
@@ -171,5 +173,57 @@ def test_round_trip_compress_bytes(b: bytes) -> None:
     assert text == decompressed
 
 
+# the options passed to compress_file and decompress_file in each mode
+FILE_MODES = [
+    ({}, {}),
+    ({"stream": True}, {"stream": True}),
+    ({"mapped": True}, {"mapped": True}),
+    ({"canonical": True, "sync_interval": 100}, {}),
+    ({"legacy": True}, {}),
+    ({"legacy": True, "sync_interval": 100}, {}),
+    ({"max_code_length": 9}, {}),
+    ({"blocks": True, "workers": 2}, {"workers": 2}),
+    ({"adaptive": True}, {}),
+    ({"digrams": True, "max_code_length": 12}, {}),
+    ({"context": True}, {}),
+    ({"lz77": 1}, {}),
+    ({"lz77": 9}, {"stream": True}),
+    ({"bwt": True}, {"stream": True}),
+    ({"filters": True, "canonical": True}, {}),
+    ({"dictionary": True}, {"dictionary": True}),
+]
+
+
+@pytest.mark.parametrize("compress_options, decompress_options", FILE_MODES)
+@settings(max_examples=20, deadline=None)
+@given(binary(min_size=0, max_size=2000))
+def test_round_trip_compress_file(compress_options: dict,
+                                  decompress_options: dict,
+                                  b: bytes) -> None:
+    """ Test that compress_file and then decompress_file will produce the
+    original file in each of its modes. A dictionary is trained on a sample
+    that leaves out most of the bytes, which still have to get codes.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        in_file = os.path.join(tmp, "in")
+        with open(in_file, "wb") as f:
+            f.write(b)
+        compress_options = dict(compress_options)
+        decompress_options = dict(decompress_options)
+        if "dictionary" in compress_options:
+            sample = os.path.join(tmp, "sample")
+            with open(sample, "wb") as f:
+                f.write(b"helloworld")
+            dictionary = os.path.join(tmp, "dict")
+            train_dictionary([sample], dictionary)
+            compress_options["dictionary"] = dictionary
+            decompress_options["dictionary"] = dictionary
+        compress_file(in_file, in_file + ".huf", **compress_options)
+        decompress_file(in_file + ".huf", in_file + ".orig",
+                        **decompress_options)
+        with open(in_file + ".orig", "rb") as f:
+            assert f.read() == b
+
+
 if __name__ == "__main__":
     pytest.main(["test_huffman_properties_basic.py"])
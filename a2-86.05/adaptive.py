@@ -0,0 +1,283 @@
+"""
+Adaptive Huffman coding (the FGK algorithm) for CSC148 Assignment 2.
+
+Unlike compress_file, which needs the frequencies of the whole input before
+it can write a single bit, the tree here starts out empty and is updated
+after every symbol. The decoder makes the same updates in the same order,
+so no tree is stored and the input is only read once, which works for pipes
+and other inputs that cannot be rewound. The tree never has more than
+2 * 258 - 1 nodes, so memory use does not depend on the size of the input.
+"""
+from __future__ import annotations
+
+from typing import BinaryIO, Iterator, Optional
+
+# symbols are bytes, plus one more that marks the end of the input
+EOF = 256
+
+# number of bits used to send a symbol the first time it appears
+SYMBOL_BITS = 9
+
+# number of bytes read or written at a time
+CHUNK_SIZE = 1 << 16
+
+
+class AdaptiveNode:
+    """ A node in an AdaptiveHuffmanTree.
+
+    Public Attributes:
+    ===========
+    symbol: the symbol of this leaf, or None if this is an internal node or
+        the NYT (not yet transmitted) leaf
+    weight: the number of times the symbols under this node have been seen
+    number: the position of this node in the order of the sibling property
+    parent: the parent of this node, or None for the root
+    left: left child of this node, or None for a leaf
+    right: right child of this node, or None for a leaf
+    """
+    __slots__ = ['symbol', 'weight', 'number', 'parent', 'left', 'right']
+    symbol: Optional[int]
+    weight: int
+    number: int
+    parent: Optional[AdaptiveNode]
+    left: Optional[AdaptiveNode]
+    right: Optional[AdaptiveNode]
+
+    def __init__(self, number: int, parent: Optional[AdaptiveNode] = None,
+                 symbol: Optional[int] = None) -> None:
+        """ Create a new leaf with weight 0 and the given parameters."""
+        self.symbol = symbol
+        self.weight = 0
+        self.number = number
+        self.parent = parent
+        self.left, self.right = None, None
+
+
+class AdaptiveHuffmanTree:
+    """ A Huffman tree that is kept optimal for the symbols seen so far.
+
+    The nodes satisfy the sibling property: listed by increasing number, their
+    weights never decrease, and siblings are next to each other. Symbols that
+    have not been seen yet all share the NYT leaf, whose weight is 0.
+
+    Public Attributes:
+    ===========
+    root: the root of this tree
+    nyt: the leaf that stands for the symbols not seen yet
+    """
+    root: AdaptiveNode
+    nyt: AdaptiveNode
+    # _leaves: the leaf of every symbol seen so far
+    # _order: the nodes of this tree, indexed by their number
+    _leaves: dict[int, AdaptiveNode]
+    _order: list[Optional[AdaptiveNode]]
+
+    def __init__(self) -> None:
+        """ Create a new tree that has seen no symbols yet."""
+        # one leaf per symbol, including EOF, and one for NYT
+        size = 2 * (EOF + 2) - 1
+        self.root = AdaptiveNode(size - 1)
+        self.nyt = self.root
+        self._leaves = {}
+        self._order = [None] * size
+        self._order[self.root.number] = self.root
+
+    def code(self, symbol: int) -> tuple[int, int]:
+        """ Return the (code, length) pair for <symbol>, where code is the
+        code read as a <length>-bit binary number. A symbol that has not been
+        seen yet gets the code of the NYT leaf followed by the symbol itself
+        in SYMBOL_BITS bits.
+
+        >>> t = AdaptiveHuffmanTree()
+        >>> t.code(65)
+        (65, 9)
+        >>> t.update(65)
+        >>> t.code(65)
+        (1, 1)
+        >>> t.code(66)
+        (66, 10)
+        """
+        node = self._leaves.get(symbol)
+        if node is None:
+            code, length = self._path(self.nyt)
+            return (code << SYMBOL_BITS) | symbol, length + SYMBOL_BITS
+        return self._path(node)
+
+    def _path(self, node: AdaptiveNode) -> tuple[int, int]:
+        """ Return the (code, length) pair for the path from the root to
+        <node>.
+        """
+        code = 0
+        length = 0
+        while node.parent is not None:
+            if node.parent.right is node:
+                code |= 1 << length
+            length += 1
+            node = node.parent
+        return code, length
+
+    def update(self, symbol: int) -> None:
+        """ Record one more occurrence of <symbol>, and restore the sibling
+        property by swapping each node on the way to the root with the
+        highest numbered node of the same weight.
+
+        >>> t = AdaptiveHuffmanTree()
+        >>> for s in b'abb':
+        ...     t.update(s)
+        >>> t.root.weight, t.root.right.symbol, t.root.right.weight
+        (3, 98, 2)
+        """
+        node = self._leaves.get(symbol)
+        if node is None:
+            # the NYT leaf gets two children: the new NYT leaf and the leaf
+            # of <symbol>, both of weight 0
+            old = self.nyt
+            self.nyt = AdaptiveNode(old.number - 2, old)
+            node = AdaptiveNode(old.number - 1, old, symbol)
+            old.left, old.right = self.nyt, node
+            self._order[self.nyt.number] = self.nyt
+            self._order[node.number] = node
+            self._leaves[symbol] = node
+        while node is not None:
+            leader = self._leader(node)
+            if leader is not node and leader is not node.parent:
+                self._swap(node, leader)
+            node.weight += 1
+            node = node.parent
+
+    def _leader(self, node: AdaptiveNode) -> AdaptiveNode:
+        """ Return the highest numbered node with the same weight as <node>.
+        """
+        order = self._order
+        number = node.number
+        while (number + 1 < len(order)
+               and order[number + 1].weight == node.weight):
+            number += 1
+        return order[number]
+
+    def _swap(self, a: AdaptiveNode, b: AdaptiveNode) -> None:
+        """ Swap the subtrees rooted at <a> and <b>, along with their numbers.
+
+        Precondition: neither of <a> and <b> is an ancestor of the other.
+        """
+        a_parent, b_parent = a.parent, b.parent
+        if a_parent is b_parent:
+            a_parent.left, a_parent.right = a_parent.right, a_parent.left
+        else:
+            if a_parent.left is a:
+                a_parent.left = b
+            else:
+                a_parent.right = b
+            if b_parent.left is b:
+                b_parent.left = a
+            else:
+                b_parent.right = a
+            a.parent, b.parent = b_parent, a_parent
+        a.number, b.number = b.number, a.number
+        self._order[a.number], self._order[b.number] = a, b
+
+
+def adaptive_compress(src: BinaryIO, dst: BinaryIO) -> int:
+    """ Compress everything left in the binary stream <src> into the binary
+    stream <dst> in a single pass, and return the number of bytes read.
+
+    The output ends with the code of EOF, padded with zeros to a whole byte.
+    """
+    tree = AdaptiveHuffmanTree()
+    result = bytearray()
+    buffer = 0
+    count = 0
+    size = 0
+    chunk = src.read(CHUNK_SIZE)
+    while True:
+        for symbol in chunk or [EOF]:
+            code, length = tree.code(symbol)
+            tree.update(symbol)
+            buffer = (buffer << length) | code
+            count += length
+            while count >= 8:
+                count -= 8
+                result.append(buffer >> count)
+                buffer &= (1 << count) - 1
+        if not chunk:
+            break
+        size += len(chunk)
+        if len(result) >= CHUNK_SIZE:
+            dst.write(result)
+            result = bytearray()
+        chunk = src.read(CHUNK_SIZE)
+    if count > 0:
+        result.append(buffer << (8 - count))
+    dst.write(result)
+    return size
+
+
+def _read_bits(src: BinaryIO) -> Iterator[int]:
+    """ Yield the bits of everything left in the binary stream <src>, most
+    significant bit of each byte first.
+    """
+    chunk = src.read(CHUNK_SIZE)
+    while chunk:
+        for byte in chunk:
+            for bit_num in range(7, -1, -1):
+                yield (byte >> bit_num) & 1
+        chunk = src.read(CHUNK_SIZE)
+
+
+def adaptive_decompress(src: BinaryIO, dst: BinaryIO, size: int = -1) -> int:
+    """ Decompress the output of adaptive_compress from the binary stream
+    <src> into the binary stream <dst>, and return the number of bytes
+    written. If <size> is not -1, stop after the first <size> bytes.
+
+    >>> import io
+    >>> compressed = io.BytesIO()
+    >>> adaptive_compress(io.BytesIO(b'abracadabra'), compressed)
+    11
+    >>> decompressed = io.BytesIO()
+    >>> adaptive_decompress(io.BytesIO(compressed.getvalue()), decompressed)
+    11
+    >>> decompressed.getvalue()
+    b'abracadabra'
+    >>> adaptive_decompress(io.BytesIO(compressed.getvalue()), decompressed, 4)
+    4
+    >>> decompressed.getvalue()
+    b'abracadabraabra'
+    """
+    tree = AdaptiveHuffmanTree()
+    bits = _read_bits(src)
+    result = bytearray()
+    written = 0
+    while written + len(result) != size:
+        node = tree.root
+        while node.left is not None:
+            node = node.right if next(bits) else node.left
+        if node is tree.nyt:
+            symbol = 0
+            for _ in range(SYMBOL_BITS):
+                symbol = (symbol << 1) | next(bits)
+        else:
+            symbol = node.symbol
+        if symbol == EOF:
+            break
+        tree.update(symbol)
+        result.append(symbol)
+        if len(result) >= CHUNK_SIZE:
+            dst.write(result)
+            written += len(result)
+            result = bytearray()
+    dst.write(result)
+    return written + len(result)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'doctest', '__future__', 'typing', 'io'
+        ]
+    })
@@ -0,0 +1,386 @@
+"""
+Asynchronous versions of compress_file and decompress_file, for programs
+that serve many requests on one asyncio event loop.
+
+Compressing is CPU-bound, so each call runs compress_file or
+decompress_file in an executor and waits for it without blocking the loop.
+A ThreadPoolExecutor keeps the loop responsive, and a ProcessPoolExecutor
+also lets calls run in parallel, as long as the options passed are
+picklable. Without an executor, a thread pool shared by this module is used.
+The files the streaming functions open, and the temporary files they make
+and remove, are handled through asyncio.to_thread for the same reason.
+
+Cancelling a call stops the job if it has not started yet. A job that has
+started runs to the end, since neither threads nor processes can be
+stopped part way, but its output is thrown away: <out_file> is only written
+once the job succeeds, and temporary files are removed when it finishes.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import tempfile
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Optional
+
+from compress import CHUNK_SIZE, compress_file, decompress_file
+
+# added to the name of an output file while it is being written
+PART_SUFFIX = ".part"
+
+
+@lru_cache(maxsize=None)
+def _default_executor() -> Executor:
+    """ Return the executor used when none is given."""
+    return ThreadPoolExecutor(thread_name_prefix="huffman")
+
+
+def _submit(executor: Optional[Executor], function: Callable[..., Any],
+            *args: Any) -> Future:
+    """ Start calling <function> with <args> in <executor>, or in the
+    default executor if it is None, and return its future.
+    """
+    return (executor or _default_executor()).submit(function, *args)
+
+
+def _remove(path: str) -> None:
+    """ Remove the file or directory <path>, if there is one."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+async def _remove_after(future: Optional[Future], path: str) -> None:
+    """ Remove the file or directory <path> without blocking the event loop:
+    now if <future> is None or done, and otherwise once it is done, since
+    its job may still be using <path>.
+    """
+    if future is None or future.done():
+        await asyncio.to_thread(_remove, path)
+    else:
+        # the callback runs in the thread that finishes <future>
+        future.add_done_callback(lambda _: _remove(path))
+
+
+async def _run_to(out_file: str, executor: Optional[Executor],
+                  function: Callable[..., Any], *args: Any) -> None:
+    """ Call <function> with <args> and then the name of a temporary file in
+    <executor>, and move that file to <out_file> once it returns.
+    """
+    part = out_file + PART_SUFFIX
+    future = _submit(executor, function, *args, part)
+    try:
+        await asyncio.wrap_future(future)
+        await asyncio.to_thread(os.replace, part, out_file)
+    finally:
+        await _remove_after(future, part)
+
+
+async def compress_file_async(in_file: str, out_file: str,
+                              executor: Optional[Executor] = None,
+                              **options: Any) -> None:
+    """ Compress the file <in_file> into <out_file> like compress_file,
+    passing it <options>, but in <executor>.
+
+    Precondition: The contents of the file <in_file> are not empty.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(b"helloworld" * 10)
+    ...     asyncio.run(compress_file_async(tmp + "/in", tmp + "/out"))
+    ...     asyncio.run(decompress_file_async(tmp + "/out", tmp + "/orig"))
+    ...     with open(tmp + "/orig", "rb") as f:
+    ...         f.read() == b"helloworld" * 10
+    ...     sorted(os.listdir(tmp))
+    Bits per symbol: 2.7
+    True
+    ['in', 'orig', 'out']
+
+    Cancelling a call while its job is running leaves no output behind. Here
+    the job is held up at its first measurement until it is released.
+
+    >>> import threading
+    >>> started, release = threading.Event(), threading.Event()
+    >>> def hold(name, value):
+    ...     started.set()
+    ...     release.wait()
+    >>> async def cancel(in_file, out_file, executor):
+    ...     task = asyncio.create_task(compress_file_async(
+    ...         in_file, out_file, executor, metrics=hold))
+    ...     await asyncio.to_thread(started.wait)
+    ...     task.cancel()
+    ...     try:
+    ...         await task
+    ...     except asyncio.CancelledError:
+    ...         print("cancelled")
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(b"helloworld" * 10)
+    ...     with ThreadPoolExecutor(1) as executor:
+    ...         asyncio.run(cancel(tmp + "/in", tmp + "/out", executor))
+    ...         release.set()
+    ...     sorted(os.listdir(tmp))
+    cancelled
+    Bits per symbol: 2.7
+    ['in']
+    """
+    await _run_to(out_file, executor, partial(compress_file, **options),
+                  in_file)
+
+
+async def decompress_file_async(in_file: str, out_file: str,
+                                executor: Optional[Executor] = None,
+                                **options: Any) -> None:
+    """ Decompress the file <in_file> into <out_file> like decompress_file,
+    passing it <options>, but in <executor>.
+
+    Precondition: The contents of the file <in_file> are not empty.
+    """
+    await _run_to(out_file, executor, partial(decompress_file, **options),
+                  in_file)
+
+
+def _convert(function: Callable[..., Any], data: bytes,
+             options: dict[str, Any]) -> bytes:
+    """ Return the contents of the file that <function> writes when it is
+    called with the names of a file holding <data> and of the file to write,
+    and <options>.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        in_file = os.path.join(tmp, "in")
+        out_file = os.path.join(tmp, "out")
+        with open(in_file, "wb") as f:
+            f.write(data)
+        function(in_file, out_file, **options)
+        with open(out_file, "rb") as f:
+            return f.read()
+
+
+async def compress_bytes_async(data: bytes,
+                               executor: Optional[Executor] = None,
+                               **options: Any) -> bytes:
+    """ Return <data> compressed with compress_file, passing it <options>,
+    in <executor>.
+
+    Precondition: <data> is not empty.
+
+    >>> compressed = asyncio.run(compress_bytes_async(b"helloworld" * 10))
+    Bits per symbol: 2.7
+    >>> asyncio.run(decompress_bytes_async(compressed))
+    b'helloworldhelloworldhelloworldhelloworldhelloworldhelloworldhello\
+worldhelloworldhelloworldhelloworld'
+    """
+    return await asyncio.wrap_future(
+        _submit(executor, _convert, compress_file, data, options))
+
+
+async def decompress_bytes_async(data: bytes,
+                                 executor: Optional[Executor] = None,
+                                 **options: Any) -> bytes:
+    """ Return <data> decompressed with decompress_file, passing it
+    <options>, in <executor>.
+
+    Precondition: <data> is not empty.
+    """
+    return await asyncio.wrap_future(
+        _submit(executor, _convert, decompress_file, data, options))
+
+
+async def _receive(reader: asyncio.StreamReader, path: str) -> None:
+    """ Write everything <reader> sends into the file <path>.
+
+    Only one chunk is held at a time, and the next one is not read until it
+    has been written, so a fast sender is held back by the flow control of
+    <reader> instead of filling up memory.
+
+    A slow sender is waited for until it closes the stream:
+
+    >>> async def send_slowly(reader):
+    ...     for piece in [b"hello", b"world"]:
+    ...         await asyncio.sleep(0.01)
+    ...         reader.feed_data(piece)
+    ...     reader.feed_eof()
+    >>> async def receive(path):
+    ...     reader = asyncio.StreamReader()
+    ...     sender = asyncio.create_task(send_slowly(reader))
+    ...     await _receive(reader, path)
+    ...     await sender
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     asyncio.run(receive(tmp + "/in"))
+    ...     with open(tmp + "/in", "rb") as f:
+    ...         f.read()
+    b'helloworld'
+    """
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        chunk = await reader.read(CHUNK_SIZE)
+        while chunk:
+            await asyncio.to_thread(f.write, chunk)
+            chunk = await reader.read(CHUNK_SIZE)
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def _send(path: str, writer: asyncio.StreamWriter) -> int:
+    """ Send the contents of the file <path> through <writer>, and return
+    the number of bytes sent.
+
+    Each chunk is drained before the next one is read, so a slow receiver
+    holds back the reading instead of filling up memory.
+
+    >>> class SlowWriter:
+    ...     def __init__(self):
+    ...         self.buffered = self.most_buffered = 0
+    ...     def write(self, data):
+    ...         self.buffered += len(data)
+    ...         self.most_buffered = max(self.most_buffered, self.buffered)
+    ...     async def drain(self):
+    ...         await asyncio.sleep(0.01)
+    ...         self.buffered = 0
+    >>> writer = SlowWriter()
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/out", "wb") as f:
+    ...         _ = f.write(bytes(3 * CHUNK_SIZE + 1))
+    ...     asyncio.run(_send(tmp + "/out", writer)) == 3 * CHUNK_SIZE + 1
+    True
+    >>> writer.most_buffered == CHUNK_SIZE
+    True
+    """
+    sent = 0
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+        while chunk:
+            writer.write(chunk)
+            await writer.drain()
+            sent += len(chunk)
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+    finally:
+        await asyncio.to_thread(f.close)
+    return sent
+
+
+async def _convert_stream(function: Callable[..., Any],
+                          reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter,
+                          executor: Optional[Executor],
+                          options: dict[str, Any]) -> int:
+    """ Send through <writer> what <function> writes when it is called with
+    the names of a file holding everything <reader> sends and of the file to
+    write, and <options>. Return the number of bytes sent.
+
+    The temporary directory is removed even if this is cancelled while
+    <function> is running, once it returns.
+
+    >>> import threading
+    >>> started, release = threading.Event(), threading.Event()
+    >>> def hold(in_file, out_file):
+    ...     started.set()
+    ...     release.wait()
+    >>> async def cancel(executor):
+    ...     reader = asyncio.StreamReader()
+    ...     reader.feed_data(b"helloworld")
+    ...     reader.feed_eof()
+    ...     task = asyncio.create_task(
+    ...         _convert_stream(hold, reader, None, executor, {}))
+    ...     await asyncio.to_thread(started.wait)
+    ...     task.cancel()
+    ...     try:
+    ...         await task
+    ...     except asyncio.CancelledError:
+    ...         print("cancelled")
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     tempfile.tempdir = tmp
+    ...     try:
+    ...         with ThreadPoolExecutor(1) as executor:
+    ...             asyncio.run(cancel(executor))
+    ...             release.set()
+    ...     finally:
+    ...         tempfile.tempdir = None
+    ...     os.listdir(tmp)
+    cancelled
+    []
+    """
+    tmp = await asyncio.to_thread(tempfile.mkdtemp)
+    in_file = os.path.join(tmp, "in")
+    out_file = os.path.join(tmp, "out")
+    future = None
+    try:
+        await _receive(reader, in_file)
+        future = _submit(executor, partial(function, **options), in_file,
+                         out_file)
+        await asyncio.wrap_future(future)
+        return await _send(out_file, writer)
+    finally:
+        await _remove_after(future, tmp)
+
+
+async def compress_stream_async(reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter,
+                                executor: Optional[Executor] = None,
+                                **options: Any) -> int:
+    """ Compress everything <reader> sends with compress_file, passing it
+    <options>, in <executor>, send the result through <writer>, and return
+    the number of bytes sent.
+
+    A Huffman tree needs the frequencies of the whole input before the first
+    code can be written, so the input is spooled to a temporary file first.
+    Neither the input nor the output is ever held in memory whole.
+
+    >>> class Writer:
+    ...     def __init__(self):
+    ...         self.sent = bytearray()
+    ...     def write(self, data):
+    ...         self.sent += data
+    ...     async def drain(self):
+    ...         pass
+    >>> async def convert(function, data):
+    ...     reader, writer = asyncio.StreamReader(), Writer()
+    ...     reader.feed_data(data)
+    ...     reader.feed_eof()
+    ...     sent = await function(reader, writer)
+    ...     return sent == len(writer.sent), bytes(writer.sent)
+    >>> sent, compressed = asyncio.run(
+    ...     convert(compress_stream_async, b"helloworld" * 10))
+    Bits per symbol: 2.7
+    >>> asyncio.run(convert(decompress_stream_async, compressed)) == (
+    ...     True, b"helloworld" * 10)
+    True
+    """
+    return await _convert_stream(compress_file, reader, writer, executor,
+                                 options)
+
+
+async def decompress_stream_async(reader: asyncio.StreamReader,
+                                  writer: asyncio.StreamWriter,
+                                  executor: Optional[Executor] = None,
+                                  **options: Any) -> int:
+    """ Decompress everything <reader> sends with decompress_file, passing it
+    <options>, in <executor>, send the result through <writer>, and return
+    the number of bytes sent.
+
+    Precondition: <reader> sends at least one byte.
+    """
+    return await _convert_stream(decompress_file, reader, writer, executor,
+                                 options)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-io': ['_convert', '_receive', '_send'],
+        'allowed-import-modules': [
+            'python_ta', 'doctest', '__future__', 'typing', 'asyncio',
+            'concurrent.futures', 'functools', 'os', 'shutil', 'tempfile',
+            'compress'
+        ]
+    })
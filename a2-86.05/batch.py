@@ -0,0 +1,270 @@
+"""
+Compress or decompress every file under one or more directories.
+
+Each file is handled by compress_file or decompress_file, by up to
+--workers processes at once. A line is printed as each file is done, and a
+summary of the sizes, ratio, throughput and failures is printed at the end:
+
+    PYTHONPATH=a2_starter python batch.py --workers 4 a2_starter/files
+    PYTHONPATH=a2_starter python batch.py --decompress --workers 4 \
+        a2_starter/files
+
+a2_starter has to be on the path, since huffman.py and utils.py are there.
+
+Compressed files get the suffix ".huf". Decompressed ones lose it and get
+".orig" instead, so x.huf becomes x.orig, where the __main__ block of
+compress.py would write x.huf.orig. Either way no original is overwritten.
+Files ending in ".orig" are never compressed again.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Any, Iterator, Optional
+
+from compress import compress_file, decompress_file, pool_map
+
+# added to the name of each compressed file
+COMPRESSED_SUFFIX = ".huf"
+
+# added to the name of each decompressed file, after COMPRESSED_SUFFIX is
+# taken off
+DECOMPRESSED_SUFFIX = ".orig"
+
+
+def find_files(paths: list[str], decompress: bool = False) -> Iterator[str]:
+    """ Yield every file in <paths> and in the directories under them, in
+    sorted order. If <decompress> is True, only compressed files are yielded,
+    and otherwise only files that are neither compressed nor decompressed.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     os.mkdir(os.path.join(tmp, "sub"))
+    ...     for name in ["b", "a.huf", "a.orig", "sub/c"]:
+    ...         open(os.path.join(tmp, name), "w").close()
+    ...     [os.path.relpath(p, tmp) for p in find_files([tmp])]
+    ...     [os.path.relpath(p, tmp) for p in find_files([tmp], True)]
+    ['b', 'sub/c']
+    ['a.huf']
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, _, names in os.walk(path):
+                found.extend(os.path.join(directory, name) for name in names)
+            found.sort()
+        else:
+            found = [path]
+        for name in found:
+            if decompress:
+                if name.endswith(COMPRESSED_SUFFIX):
+                    yield name
+            elif not name.endswith((COMPRESSED_SUFFIX, DECOMPRESSED_SUFFIX)):
+                yield name
+
+
+def output_name(path: str, decompress: bool = False) -> str:
+    """ Return the name of the file that <path> is compressed into, or
+    decompressed into if <decompress> is True.
+
+    >>> output_name("notes.txt")
+    'notes.txt.huf'
+    >>> output_name("notes.txt.huf", True)
+    'notes.txt.orig'
+    """
+    if decompress:
+        return path[:-len(COMPRESSED_SUFFIX)] + DECOMPRESSED_SUFFIX
+    return path + COMPRESSED_SUFFIX
+
+
+def _process(job: tuple[str, bool, dict[str, Any]]) \
+        -> tuple[str, int, int, Optional[str]]:
+    """ Compress the file named in <job>, or decompress it if the flag in
+    <job> is True, passing the options in <job>. Return its name, its size,
+    the size of the output, and a description of the error if it failed, or
+    None if it did not.
+    """
+    path, decompress, options = job
+    out_file = output_name(path, decompress)
+    try:
+        # compress_file prints the bits per symbol of every file
+        with contextlib.redirect_stdout(io.StringIO()):
+            if decompress:
+                decompress_file(path, out_file, **options)
+            else:
+                compress_file(path, out_file, **options)
+        return path, os.path.getsize(path), os.path.getsize(out_file), None
+    except Exception as error:  # the other files still get done
+        return path, 0, 0, f"{type(error).__name__}: {error}"
+
+
+def run_batch(paths: list[str], decompress: bool = False, workers: int = 1,
+              **options: Any) -> dict[str, Any]:
+    """ Compress every file found by find_files in <paths>, or decompress
+    them if <decompress> is True, with up to <workers> processes, passing
+    <options> to compress_file or decompress_file. Print a line as each file
+    is done, and return the totals: the number of "files", "input_bytes",
+    "output_bytes" and "seconds", and the "failures" as a list of
+    descriptions.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     for name in ["a", "b"]:
+    ...         with open(os.path.join(tmp, name), "wb") as f:
+    ...             _ = f.write(b"helloworld" * 10)
+    ...     with contextlib.redirect_stdout(io.StringIO()):
+    ...         compressed = run_batch([tmp])
+    ...         decompressed = run_batch([tmp], decompress=True)
+    ...     for totals in [compressed, decompressed]:
+    ...         (totals["files"], totals["input_bytes"],
+    ...          totals["output_bytes"], totals["failures"])
+    ...     sorted(os.listdir(tmp))
+    (2, 200, 146, [])
+    (2, 146, 200, [])
+    ['a', 'a.huf', 'a.orig', 'b', 'b.huf', 'b.orig']
+    """
+    files = list(find_files(paths, decompress))
+    totals = {"files": len(files), "input_bytes": 0, "output_bytes": 0,
+              "failures": []}
+    start = time.perf_counter()
+    jobs = ((path, decompress, options) for path in files)
+    for done, result in enumerate(pool_map(_process, jobs, workers), 1):
+        path, size, out_size, error = result
+        if error is None:
+            totals["input_bytes"] += size
+            totals["output_bytes"] += out_size
+            print(f"[{done}/{len(files)}] {path}: {size} -> {out_size} bytes")
+        else:
+            totals["failures"].append(f"{path}: {error}")
+            print(f"[{done}/{len(files)}] {path}: failed, {error}")
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+def summary(totals: dict[str, Any], decompress: bool = False) -> str:
+    """ Return a description of the <totals> returned by run_batch, which
+    decompressed the files if <decompress> is True.
+
+    Either way, the speed is in MB of original files per second, and the
+    ratio is the size of the original files over the compressed ones.
+
+    >>> print(summary({"files": 3, "input_bytes": 3 << 20,
+    ...                "output_bytes": 1 << 20, "seconds": 2.0,
+    ...                "failures": ["x: OSError"]}))
+    2 of 3 files done in 2.00 s, 1.50 MB/s
+    3.00 MB -> 1.00 MB, ratio 3.000
+    1 failed:
+      x: OSError
+    >>> print(summary({"files": 1, "input_bytes": 1 << 20,
+    ...                "output_bytes": 3 << 20, "seconds": 2.0,
+    ...                "failures": []}, decompress=True))
+    1 of 1 files done in 2.00 s, 1.50 MB/s
+    1.00 MB -> 3.00 MB, ratio 3.000
+    """
+    done = totals["files"] - len(totals["failures"])
+    original, compressed = totals["input_bytes"], totals["output_bytes"]
+    if decompress:
+        original, compressed = compressed, original
+    lines = [f"{done} of {totals['files']} files done in "
+             f"{totals['seconds']:.2f} s, "
+             f"{original / (1 << 20) / max(totals['seconds'], 1e-9):.2f} "
+             f"MB/s",
+             f"{totals['input_bytes'] / (1 << 20):.2f} MB -> "
+             f"{totals['output_bytes'] / (1 << 20):.2f} MB, ratio "
+             f"{original / max(compressed, 1):.3f}"]
+    if totals["failures"]:
+        lines.append(f"{len(totals['failures'])} failed:")
+        lines.extend("  " + failure for failure in totals["failures"])
+    return "\n".join(lines)
+
+
+def add_mode_arguments(parser: argparse.ArgumentParser) -> None:
+    """ Add the options of compress_file that pick how a file is coded to
+    <parser>, and the dictionary for decompress_file.
+    """
+    parser.add_argument("--canonical", action="store_true",
+                        help="store canonical code lengths")
+    parser.add_argument("--blocks", action="store_true",
+                        help="give each block its own tree")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="use adaptive Huffman codes")
+    parser.add_argument("--digrams", action="store_true",
+                        help="code frequent pairs of bytes together")
+    parser.add_argument("--context", action="store_true",
+                        help="pick the codes by the byte before")
+    parser.add_argument("--max-code-length", type=int, default=0,
+                        help="longest code allowed, or 0 for no limit")
+    parser.add_argument("--dictionary",
+                        help="dictionary file made by train_dictionary")
+    parser.add_argument("--lz77", type=int, default=0, choices=range(10),
+                        metavar="LEVEL",
+                        help="level from 1 to 9 of the match finder run first,"
+                        " or 0 for none")
+    parser.add_argument("--bwt", action="store_true",
+                        help="sort blocks with the Burrows-Wheeler transform")
+    parser.add_argument("--filters", action="store_true",
+                        help="filter blocks by predicting each byte")
+
+
+def mode_options(args: argparse.Namespace,
+                 decompress: bool = False) -> dict[str, Any]:
+    """ Return the options for compress_file, or for decompress_file if
+    <decompress> is True, in the <args> parsed by a parser that
+    add_mode_arguments was called on.
+
+    >>> parser = argparse.ArgumentParser()
+    >>> add_mode_arguments(parser)
+    >>> args = parser.parse_args(["--lz77", "6"])
+    >>> mode_options(args)["lz77"], mode_options(args, True)
+    (6, {'dictionary': None})
+    """
+    if decompress:
+        return {"dictionary": args.dictionary}
+    return {"canonical": args.canonical, "blocks": args.blocks,
+            "adaptive": args.adaptive, "digrams": args.digrams,
+            "context": args.context, "max_code_length": args.max_code_length,
+            "dictionary": args.dictionary, "lz77": args.lz77,
+            "bwt": args.bwt, "filters": args.filters}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """ Run the batch with the command line arguments <argv>, print the
+    summary, and return 1 if any file failed or 0 otherwise.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(os.path.join(tmp, "a"), "wb") as f:
+    ...         _ = f.write(b"helloworld" * 10)
+    ...     with open(os.path.join(tmp, "b.huf"), "wb") as f:
+    ...         _ = f.write(b"not compressed")
+    ...     with contextlib.redirect_stdout(io.StringIO()) as out:
+    ...         codes = [main(["--workers", "1", "--lz77", "6", tmp]),
+    ...                  main(["--decompress", "--workers", "1", tmp])]
+    ...     with open(os.path.join(tmp, "a.orig"), "rb") as f:
+    ...         f.read() == b"helloworld" * 10
+    True
+    >>> codes, out.getvalue().count(": failed, ")
+    ([0, 1], 1)
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+",
+                        help="files and directories to process")
+    parser.add_argument("-d", "--decompress", action="store_true",
+                        help="decompress the .huf files instead")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of processes")
+    add_mode_arguments(parser)
+    args = parser.parse_args(argv)
+
+    options = mode_options(args, args.decompress)
+    totals = run_batch(args.paths, args.decompress, args.workers, **options)
+    print(summary(totals, args.decompress))
+    return 1 if totals["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
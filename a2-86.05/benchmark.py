@@ -0,0 +1,264 @@
+"""
+Benchmarks for the Huffman compressor in compress.py.
+
+Every file in a2_starter/files and a generated input of each size in
+GENERATED_SIZES is compressed and decompressed with compress_file and
+decompress_file. For each input, the results record the speed in MB/s,
+the compression ratio, the bits per symbol, and the peak memory used by
+each step. The results can be saved as JSON and compared with an earlier
+run to find regressions:
+
+    PYTHONPATH=a2_starter python benchmark.py --save baseline.json
+    PYTHONPATH=a2_starter python benchmark.py --baseline baseline.json
+
+The same options as in batch.py pick the mode to benchmark, such as
+--lz77 6 or --bwt, and each result is named by its input and its mode, so
+a run is only compared with the results of the same mode.
+
+a2_starter has to be on the path, since huffman.py and utils.py are there.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from batch import add_mode_arguments, mode_options
+from compress import compress_file, decompress_file
+
+# the directory of the sample files that come with the assignment
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "a2_starter", "files")
+
+# sizes in bytes of the generated inputs
+GENERATED_SIZES = [1 << 16, 1 << 20, 1 << 23]
+
+# how much worse than the baseline a result can be before it is reported,
+# as a fraction of the baseline
+TOLERANCE = 0.1
+
+# the options of compress_file that decompress_file takes too
+DECOMPRESS_OPTIONS = ("stream", "workers", "mapped", "dictionary")
+
+
+def generate_input(size: int, seed: int = 148) -> bytes:
+    """ Return <size> bytes of text whose letters follow a skewed
+    distribution, like the letters of English. The same <size> and <seed>
+    always give the same bytes.
+
+    >>> len(generate_input(1000))
+    1000
+    >>> generate_input(1000) == generate_input(1000)
+    True
+    """
+    rng = random.Random(seed)
+    alphabet = b" etaoinshrdlcumwfgypbvkjxqz\n.,"
+    weights = [1 / (rank + 1) for rank in range(len(alphabet))]
+    return bytes(rng.choices(alphabet, weights, k=size))
+
+
+def mode_name(options: dict[str, Any]) -> str:
+    """ Return the name of the mode of compress_file that <options> pick:
+    the options that are set, or "default" if none are.
+
+    >>> mode_name({"canonical": False, "lz77": 0})
+    'default'
+    >>> mode_name({"bwt": True, "max_code_length": 12, "dictionary": None})
+    'bwt,max_code_length=12'
+    """
+    names = [name if value is True else f"{name}={value}"
+             for name, value in options.items() if value]
+    return ",".join(names) or "default"
+
+
+def _timed(function: Callable[[], Any], repeat: int) -> float:
+    """ Return the shortest time in seconds that calling <function> took,
+    out of <repeat> calls.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(function: Callable[[], Any]) -> int:
+    """ Return the peak number of bytes allocated while calling <function>.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_file(path: str, repeat: int = 3, **options: Any) \
+        -> dict[str, float]:
+    """ Return the results of compressing the file <path> with
+    compress_file, passing it <options>, and decompressing it again with
+    decompress_file, passing it those of <options> in DECOMPRESS_OPTIONS.
+
+    The speeds are the best of <repeat> runs, and the time each stage took
+    in the last of them is included too, as "compress_<stage>_seconds" and
+    "decompress_<stage>_seconds". The peak memory is measured in one more
+    run of each step, since tracing allocations slows it down.
+
+    >>> from compress import train_dictionary
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(generate_input(1000))
+    ...     _ = train_dictionary([tmp + "/in"], tmp + "/dict")
+    ...     result = benchmark_file(tmp + "/in", 1, dictionary=tmp + "/dict")
+    >>> result["size"], result["compressed_size"] < 1000
+    (1000, True)
+    """
+    decompress_options = {name: value for name, value in options.items()
+                          if name in DECOMPRESS_OPTIONS}
+    with tempfile.TemporaryDirectory() as tmp:
+        compressed = os.path.join(tmp, "out.huf")
+        decompressed = os.path.join(tmp, "out.orig")
+
+        # the time each stage took in the last run of each step
+        stages = {}
+
+        def compress() -> None:
+            compress_file(path, compressed, metrics=lambda name, value:
+                          stages.__setitem__("compress_" + name, value),
+                          **options)
+
+        def decompress() -> None:
+            decompress_file(compressed, decompressed,
+                            metrics=lambda name, value:
+                            stages.__setitem__("decompress_" + name, value),
+                            **decompress_options)
+
+        # compress_file prints the bits per symbol of every run
+        with contextlib.redirect_stdout(io.StringIO()):
+            compress_time = _timed(compress, repeat)
+            decompress_time = _timed(decompress, repeat)
+            timings = {name: value for name, value in stages.items()
+                       if name.endswith("_seconds")}
+            compress_peak = _peak_memory(compress)
+            decompress_peak = _peak_memory(decompress)
+        with open(path, "rb") as f, open(decompressed, "rb") as g:
+            if f.read() != g.read():
+                raise ValueError(f"{path} did not decompress to itself")
+        size = os.path.getsize(path)
+        compressed_size = os.path.getsize(compressed)
+    megabytes = size / (1 << 20)
+    return {
+        "size": size,
+        "compressed_size": compressed_size,
+        "ratio": size / compressed_size,
+        "bits_per_symbol": 8 * compressed_size / size,
+        "compress_mb_s": megabytes / compress_time,
+        "decompress_mb_s": megabytes / decompress_time,
+        "compress_peak_mb": compress_peak / (1 << 20),
+        "decompress_peak_mb": decompress_peak / (1 << 20),
+        **timings
+    }
+
+
+def run_benchmarks(sizes: Optional[list[int]] = None, repeat: int = 3,
+                   **options: Any) -> dict[str, dict[str, float]]:
+    """ Return the results of benchmark_file, passing it <options>, for
+    every file in FILES_DIR and for a generated input of each size in
+    <sizes>. <sizes> is GENERATED_SIZES if it is None. Each result is named
+    "<input> [<mode>]", where <mode> is the mode_name of <options>.
+    """
+    mode = mode_name(options)
+    results = {}
+    for name in sorted(os.listdir(FILES_DIR)):
+        path = os.path.join(FILES_DIR, name)
+        results[f"{name} [{mode}]"] = benchmark_file(path, repeat, **options)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in GENERATED_SIZES if sizes is None else sizes:
+            path = os.path.join(tmp, f"generated-{size}")
+            with open(path, "wb") as f:
+                f.write(generate_input(size))
+            results[f"generated-{size} [{mode}]"] = benchmark_file(
+                path, repeat, **options)
+    return results
+
+
+def find_regressions(results: dict[str, dict[str, float]],
+                     baseline: dict[str, dict[str, float]],
+                     tolerance: float = TOLERANCE) -> list[str]:
+    """ Return a description of every result in <results> that is worse
+    than the same result in <baseline> by more than <tolerance>, as a
+    fraction of the baseline. Inputs that are only in one of them are
+    skipped.
+
+    >>> old = {'a': {'compress_mb_s': 10.0, 'ratio': 2.0}}
+    >>> find_regressions({'a': {'compress_mb_s': 9.5, 'ratio': 2.0}}, old)
+    []
+    >>> for r in find_regressions({'a': {'compress_mb_s': 5.0}}, old):
+    ...     print(r)
+    a: compress_mb_s fell from 10.00 to 5.00
+    """
+    regressions = []
+    for name, result in results.items():
+        for key, value in result.items():
+            old = baseline.get(name, {}).get(key)
+            if old is None:
+                continue
+            if key.endswith("_mb_s") or key == "ratio":
+                if value < old * (1 - tolerance):
+                    regressions.append(
+                        f"{name}: {key} fell from {old:.2f} to {value:.2f}")
+            elif key.endswith("_peak_mb"):
+                if value > old * (1 + tolerance):
+                    regressions.append(
+                        f"{name}: {key} rose from {old:.2f} to {value:.2f}")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """ Run the benchmarks with the command line arguments <argv>, print the
+    results, and return 1 if there were regressions or 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="*",
+                        default=GENERATED_SIZES,
+                        help="sizes in bytes of the generated inputs")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of timed runs of each step")
+    parser.add_argument("--save", help="file to save the results to")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="fraction a result can get worse by")
+    add_mode_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, **mode_options(args))
+    print(f"{'input':<48}{'ratio':>8}{'bits':>8}{'comp MB/s':>11}"
+          f"{'dec MB/s':>10}{'comp MB':>9}{'dec MB':>8}")
+    for name, r in results.items():
+        print(f"{name:<48}{r['ratio']:>8.3f}{r['bits_per_symbol']:>8.3f}"
+              f"{r['compress_mb_s']:>11.2f}{r['decompress_mb_s']:>10.2f}"
+              f"{r['compress_peak_mb']:>9.1f}{r['decompress_peak_mb']:>8.1f}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f),
+                                           args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+The Burrows-Wheeler transform and the stages after it in bzip2, for CSC148
+Assignment 2.
+
+bwt_transform sorts the rotations of a block, which puts bytes that come
+before the same contexts next to each other. move_to_front then turns the
+long runs of a few bytes that this makes into runs of zeros and small
+numbers, and zero_runs writes each run of zeros in a few symbols.
+compress.py codes those symbols with Huffman codes, one set per block.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any
+
+# numpy is optional, it only makes sorting the rotations of bwt_transform
+# and undoing it faster
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# blocks shorter than this are sorted without numpy even if it is there
+NUMPY_MIN_SIZE = 1 << 16
+
+# the symbols of zero_runs: a run of zeros is a number written in RUNA and
+# RUNB, and every other move_to_front rank r is the symbol r + 1
+RUNA = 0
+RUNB = 1
+BWT_SYMBOLS = 257
+
+
+def bwt_transform(block: bytes) -> tuple[bytes, int]:
+    """ Return the Burrows-Wheeler transform of <block>: the last byte of
+    every rotation of <block>, with the rotations in sorted order, and the
+    index of <block> itself among them.
+
+    Bytes that come before the same contexts end up next to each other, so
+    the result has long runs of a few bytes.
+
+    >>> bwt_transform(b"banana")
+    (b'nnbaaa', 3)
+    """
+    order = _rotation_order(block)
+    return bytes([block[start - 1] for start in order]), order.index(0)
+
+
+def _rotation_order(block: bytes) -> list[int]:
+    """ Return the start of every rotation of <block>, with the rotations in
+    sorted order. Equal rotations are in order of their start.
+
+    The rotations are sorted by prefix doubling: by their first byte, then
+    by the ranks of their first 2, 4, 8 and so on bytes, until every rank is
+    different. A round that splits no group of rotations with the same rank
+    means every group is made of equal rotations, as in a periodic block,
+    so the rounds stop there too. There are at most as many rounds as the
+    bits in the length of the longest repeat.
+
+    numpy does the rounds if it is there, as Manber and Myers do: the
+    rotations <step> bytes before those in the order of the last round are
+    already in order of their second rank, so each round is a stable radix
+    sort by the first rank, in O(n) time, and the whole sort is O(n log n).
+    In pure python a radix sort is slower than sorted(), so, as in Larsson
+    and Sadakane's qsufsort, each round only sorts the groups that still
+    have the same rank, by the rank of the rotation <step> bytes on. That
+    takes O(m log m) time for the m rotations in those groups, and so
+    O(n log^2 n) at worst. Both give the same result.
+
+    >>> _rotation_order(b"banana")
+    [5, 3, 1, 0, 4, 2]
+    >>> _rotation_order(b"abab")
+    [0, 2, 1, 3]
+    """
+    size = len(block)
+    step = 1
+    if np is not None and size >= NUMPY_MIN_SIZE:
+        data = np.frombuffer(block, dtype=np.uint8)
+        order = np.argsort(data, kind="stable").astype(np.int32)
+        rank = data.astype(np.int32)
+        # the ranks of the rotations in <order>
+        ordered = rank[order]
+        groups = np.count_nonzero(np.bincount(data, minlength=256))
+        while groups < size and step < size:
+            shifted = order - step
+            shifted[shifted < 0] += size
+            first = rank[shifted]
+            permutation = _radix_permutation(first)
+            order = shifted[permutation]
+            first = first[permutation]
+            second = ordered[permutation]
+            changes = np.empty(size, dtype=np.int32)
+            changes[0] = 0
+            changes[1:] = ((first[1:] != first[:-1])
+                           | (second[1:] != second[:-1]))
+            ordered = np.cumsum(changes, dtype=np.int32)
+            rank[order] = ordered
+            if ordered[-1] + 1 == groups:
+                break
+            groups = int(ordered[-1]) + 1
+            step *= 2
+        if groups < size:
+            # the rotations with the same rank are equal, and go in order of
+            # their start
+            order = _radix_permutation(rank)
+        return order.tolist()
+    # the rank of a rotation is where its group starts in <order>, and
+    # <groups> holds the (start, end) of every group of more than one
+    order = sorted(range(size), key=block.__getitem__)
+    rank = [0] * size
+    groups = _split_groups(order, block, 0, size, rank, [])
+    while groups and step < size:
+        second = rank[step:] + rank[:step]
+        unsorted = []
+        for start, end in groups:
+            order[start:end] = sorted(order[start:end],
+                                      key=second.__getitem__)
+            _split_groups(order, second, start, end, rank, unsorted)
+        if unsorted == groups:
+            return order
+        groups = unsorted
+        step *= 2
+    return order
+
+
+def _radix_permutation(keys: Any) -> Any:
+    """ Return the permutation that sorts the numpy array <keys> of integers
+    less than 2 ** 32, keeping equal keys in order. numpy sorts 16-bit keys
+    with a radix sort, in O(n) time, so it is given the low and then the
+    high 16 bits of <keys>.
+    """
+    permutation = np.argsort((keys & 0xFFFF).astype(np.uint16), kind="stable")
+    if keys.max(initial=0) >> 16:
+        high = (keys[permutation] >> 16).astype(np.uint16)
+        permutation = permutation[np.argsort(high, kind="stable")]
+    return permutation
+
+
+def _split_groups(order: list[int], key: Any, start: int, end: int,
+                  rank: list[int], groups: list[tuple[int, int]]) \
+        -> list[tuple[int, int]]:
+    """ Split the rotations in order[start:end], which are sorted by <key>,
+    into groups with the same key. Set the rank of each rotation to the
+    start of its group, and append the (start, end) of the groups of more
+    than one rotation to <groups>. Return <groups>.
+
+    >>> order = [0, 2, 1, 3]
+    >>> rank = [0] * 4
+    >>> _split_groups(order, b"abab", 0, 4, rank, [])
+    [(0, 2), (2, 4)]
+    >>> rank
+    [0, 2, 0, 2]
+    """
+    head = start
+    for i in range(start + 1, end + 1):
+        if i == end or key[order[i]] != key[order[head]]:
+            if i - head > 1:
+                groups.append((head, i))
+            for rotation in order[head:i]:
+                rank[rotation] = head
+            head = i
+    return groups
+
+
+def move_to_front(text: bytes) -> bytes:
+    """ Return the position of each byte of <text> in a list of all 256
+    bytes, which starts in order, and where each byte is moved to the front
+    after it is used. A run of the same byte becomes a run of zeros.
+
+    >>> list(move_to_front(b"nnbaaa"))
+    [110, 0, 99, 99, 0, 0]
+    """
+    table = bytearray(range(256))
+    result = bytearray(len(text))
+    for i, byte in enumerate(text):
+        rank = table.index(byte)
+        if rank:
+            del table[rank]
+            table.insert(0, byte)
+            result[i] = rank
+    return bytes(result)
+
+
+def zero_runs(ranks: bytes) -> list[int]:
+    """ Return the symbols for the move_to_front <ranks>: every run of zeros
+    is its length written in base 2 with the digits RUNA for 1 and RUNB
+    for 2, least significant first, and every other rank r is r + 1.
+
+    >>> zero_runs(bytes([5, 0, 0, 0, 0, 0, 7])) == [6, RUNA, RUNB, 8]
+    True
+    """
+    symbols = []
+    # a nonzero rank at the end writes out the last run
+    for match in re.finditer(rb"(\0*)([^\0])", ranks + b"\1"):
+        run = len(match.group(1))
+        while run:
+            # with digits 1 and 2, every length has exactly one way to be
+            # written
+            symbols.append(RUNB if run % 2 == 0 else RUNA)
+            run = (run - 1) >> 1
+        symbols.append(match.group(2)[0] + 1)
+    return symbols[:-1]
+
+
+def inverse_bwt(last: bytes, index: int) -> bytes:
+    """ Return the block whose bwt_transform is (<last>, <index>).
+
+    Sorting <last> gives the first bytes of the sorted rotations, and a
+    stable sort takes each rotation to the one starting a byte later, so
+    following those links from <index> reads the block front to back.
+
+    >>> inverse_bwt(b"nnbaaa", 3)
+    b'banana'
+    """
+    if np is not None and len(last) >= NUMPY_MIN_SIZE:
+        following = np.argsort(np.frombuffer(last, dtype=np.uint8),
+                               kind="stable").tolist()
+    else:
+        following = sorted(range(len(last)), key=last.__getitem__)
+    result = bytearray(len(last))
+    row = index
+    for i in range(len(last)):
+        row = following[row]
+        result[i] = last[row]
+    return bytes(result)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'doctest', '__future__', 'typing', 're', 'numpy'
+        ]
+    })
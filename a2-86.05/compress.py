@@ -13,11 +13,158 @@ Copyright (c) 2022 Bogdan Simion, Dan Zingaro
 """
 from __future__ import annotations
 
+import binascii
+import heapq
+import io
+import mmap
+import os
+import re
 import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, \
+    Union
 
+from adaptive import adaptive_compress, adaptive_decompress
+from bwt import BWT_SYMBOLS, RUNB, bwt_transform, inverse_bwt, move_to_front, \
+    zero_runs
+from filters import FILTER_BLOCK_SIZE, FILTER_MAX_STRIDE, bitmap_layout, \
+    choose_filters, undo_filter
 from huffman import HuffmanTree
+from lz77 import LZ77_DISTANCE_CODES, LZ77_LENGTH_CODES, LZ77_LEVELS, \
+    LZ77_MAX_MATCH, LZ77_MIN_MATCH, LZ77_WINDOW, lz77_bucket, lz77_tokens
 from utils import *
 
+# numpy is optional, it only makes counting frequencies and encoding faster
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# number of bytes read or written at a time when streaming a file
+CHUNK_SIZE = 1 << 20
+
+# number of bytes of the original file in each block of a BLOCKS file
+BLOCK_SIZE = 1 << 22
+
+# A block of a BLOCKS file is normally Huffman coded and starts with the
+# number of internal nodes in its tree, like a whole ORIGINAL file. A 0 there
+# is followed by one of these tags instead.
+
+# the block is stored as it is
+BLOCK_RAW = 1
+# the block is stored as its size and its run_length_encode bytes
+BLOCK_RLE = 2
+
+# the first bytes of a dictionary file made by train_dictionary
+DICTIONARY_MAGIC = b"\0HUD"
+
+# number of dictionaries whose codes and decode tables are kept in memory
+DICTIONARY_CACHE_SIZE = 16
+
+# three or more copies of the same byte in a row
+_RUN = re.compile(rb"(.)\1{2,}", re.DOTALL)
+
+# texts shorter than this are counted with Counter even if numpy is there
+NUMPY_MIN_SIZE = 1 << 16
+
+# codes longer than this are encoded without numpy, since each code must
+# fit in a 64-bit integer
+NUMPY_MAX_CODE_LENGTH = 64
+
+# files are only split between processes to count them once every process
+# gets at least this many bytes
+PARALLEL_MIN_SIZE = 1 << 26
+
+# The first byte of a compressed file normally holds the number of internal
+# nodes in its tree, which is never 0. A 0 there is followed by a byte that
+# says which of the other formats below the file is in.
+
+# the original format, which has no marker
+ORIGINAL = 0
+# the header holds the 256 code lengths of canonical codes instead of a tree
+CANONICAL = 1
+# the file is made of blocks that are compressed independently, followed by
+# an index of the blocks
+BLOCKS = 2
+# the header also holds the bit offsets of the codes of every
+# <interval>th symbol, so decoding can start at any of them
+INDEXED = 3
+# the codes are built up as the file is read, so there is no header at all
+# and the original file is only read once
+ADAPTIVE = 4
+# the codes come from a dictionary file made by train_dictionary, and the
+# header only holds the id of the dictionary and the original size
+SHARED = 5
+# the header starts with MAGIC, then a version byte, a byte of feature flags
+# and the original size in 8 bytes, so files over 4 GB can be compressed
+FRAMED = ord("H")
+MAGIC = bytes([0, FRAMED]) + b"UF"
+
+# the newest version of the FRAMED format
+VERSION = 1
+
+# the feature flags of a FRAMED file
+# the header holds code lengths of canonical codes, as in a CANONICAL file
+FLAG_CANONICAL = 1
+# the header also holds sync points, as in an INDEXED file
+FLAG_INDEXED = 2
+# some symbols stand for pairs of bytes, so the tree has more than 256
+# leaves and is stored with 2 bytes per node number or symbol
+FLAG_DIGRAMS = 4
+
+# the most pairs of bytes that get symbols of their own in a FLAG_DIGRAMS file
+MAX_DIGRAMS = 256
+
+# pairs of bytes less frequent than this do not save enough bits to pay for
+# their place in the header
+DIGRAM_MIN_COUNT = 32
+# each byte is coded with a table picked by the byte before it, and the
+# header holds all of the tables instead of one tree
+FLAG_CONTEXT = 8
+
+# the most entries in the decode table of a FLAG_CONTEXT file, which needs
+# one row per internal node of every one of its tables
+CONTEXT_TABLE_SIZE = 1 << 18
+# the bytes are replaced with the literals and matches found by lz77_tokens,
+# and the header holds the code lengths of both of its alphabets
+FLAG_LZ77 = 16
+
+# number of bytes of the original file in each block of a FLAG_LZ77 file,
+# which gets codes of its own. Its matches can still reach back into the
+# block before it
+LZ77_BLOCK_SIZE = 1 << 20
+
+# the longest code in a FLAG_LZ77 or FLAG_BWT file, which is also the number
+# of bits their decoders look up at once
+PEEK_CODE_LENGTH = 15
+# the blocks of bytes are sorted by bwt_transform, and the results are
+# coded by move_to_front and zero_runs, as in bzip2
+FLAG_BWT = 32
+
+# number of bytes in each block sorted by bwt_transform. Sorting takes
+# memory and time that grow with the size of a block, and a bigger block
+# groups more of the same contexts together
+BWT_BLOCK_SIZE = 1 << 20
+
+# each block of bytes is replaced with its differences from the predictions
+# of a filter picked by choose_filters, and the header holds the filters
+FLAG_FILTERS = 64
+
+# the options of compress_file that replace its single Huffman tree, at most
+# one of which can be used, and the other options each of them takes
+MODE_OPTIONS = {"blocks": (), "adaptive": (), "dictionary": (),
+                "digrams": ("max_code_length",), "context": (), "lz77": (),
+                "bwt": (), "filters": ("canonical", "max_code_length")}
+
+# the options of compress_file that cannot all be used at once: <stream>
+# reads the file instead of mapping it, and a legacy INDEXED file always
+# stores its tree
+OPTION_CONFLICTS = [("stream", "mapped"),
+                    ("legacy", "canonical", "sync_interval")]
+
 
 def build_frequency_dict(text: bytes) -> dict[int, int]:
     """ Return a dictionary which maps each of the bytes in <text> to its
@@ -26,14 +173,84 @@ def build_frequency_dict(text: bytes) -> dict[int, int]:
     >>> d = build_frequency_dict(bytes([65, 66, 67, 66]))
     >>> d == {65: 1, 66: 2, 67: 1}
     True
+    >>> list(build_frequency_dict(bytes([67, 66, 67, 65]) * NUMPY_MIN_SIZE))
+    [67, 66, 65]
+    """
+    # https://docs.python.org/3/library/collections.html#collections.Counter
+    # https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+    if np is None or len(text) < NUMPY_MIN_SIZE:
+        # Counter counts in C, and just like a loop of dict.get
+        # the bytes are in the order they first appear in <text>.
+        # A memoryview gives ints even when <text> is an mmap
+        return dict(Counter(memoryview(text)))
+    data = np.frombuffer(text, dtype=np.uint8)
+    # bincount works on a copy of its input made of 8-byte integers,
+    # so it gets one chunk at a time
+    counts = np.zeros(256, dtype=np.int64)
+    for start in range(0, len(data), CHUNK_SIZE):
+        counts += np.bincount(data[start:start + CHUNK_SIZE], minlength=256)
+    # build_huffman_tree breaks ties by the order of the keys, so they still
+    # have to be in the order the bytes first appear in <text>. Usually every
+    # byte has shown up long before the end, so the windows of <text> are
+    # only looked at until then
+    num_symbols = np.count_nonzero(counts)
+    order = {}
+    start = 0
+    while len(order) < num_symbols:
+        end = start + NUMPY_MIN_SIZE
+        window = np.bincount(data[start:end], minlength=256)
+        firsts = sorted((text.find(bytes([byte]), start, end), byte)
+                        for byte in np.flatnonzero(window).tolist()
+                        if byte not in order)
+        order.update(dict.fromkeys(byte for _, byte in firsts))
+        start = end
+    return {byte: int(counts[byte]) for byte in order}
+
+
+def build_file_frequency_dict(in_file: str, workers: int = 1) \
+        -> dict[int, int]:
+    """ Return a dictionary which maps each of the bytes in the file <in_file>
+    to its frequency, reading it CHUNK_SIZE bytes at a time.
+
+    If <workers> is more than 1 and the file is large enough, it is split
+    into ranges that are counted by a pool of <workers> processes. The result
+    is the same as build_frequency_dict of the contents of the file either
+    way, including the order of the keys.
+    """
+    size = os.path.getsize(in_file)
+    workers = min(workers, size // PARALLEL_MIN_SIZE)
+    if workers <= 1:
+        return _count_range((in_file, 0, size))
+    step = -(-size // workers)
+    jobs = [(in_file, start, min(start + step, size))
+            for start in range(0, size, step)]
+    with ProcessPoolExecutor(workers) as pool:
+        # map gives back the results in the order of the ranges
+        return _merge_frequencies(pool.map(_count_range, jobs))
+
+
+def _count_range(job: tuple[str, int, int]) -> dict[int, int]:
+    """ Return the frequency dictionary of the bytes from <start> up to <end>
+    in the file <in_file>, where <job> is (<in_file>, <start>, <end>).
+    """
+    in_file, start, end = job
+    with open(in_file, "rb") as f:
+        f.seek(start)
+        return _merge_frequencies(build_frequency_dict(chunk)
+                                  for chunk in _read_chunks(f, end - start))
+
+
+def _merge_frequencies(freqs: Iterable[dict[int, int]]) -> dict[int, int]:
+    """ Return the frequency dictionary of the concatenation of the texts
+    whose frequency dictionaries are <freqs>, in order.
+
+    >>> _merge_frequencies([{66: 1, 65: 2}, {67: 1, 65: 1}])
+    {66: 1, 65: 3, 67: 1}
     """
-    # https://www.programiz.com/python-programming/methods/dictionary/get
-    # https://docs.python.org/3.9/library/stdtypes.html
     freq_dict = {}
-    for byte in text:
-        # using this code, you don't have to worry about key error
-        # dict.get returns 0 if there is no key value
-        freq_dict[byte] = freq_dict.get(byte, 0) + 1
+    for freq in freqs:
+        for byte, count in freq.items():
+            freq_dict[byte] = freq_dict.get(byte, 0) + count
     return freq_dict
 
 
@@ -64,44 +281,108 @@ def build_huffman_tree(freq_dict: dict[int, int]) -> HuffmanTree:
     >>> result = HuffmanTree(None, HuffmanTree(symbol), dummy_tree)
     >>> t.left == result.left or t.right == result.left
     True
+    >>> build_huffman_tree({300: 4})
+    HuffmanTree(None, HuffmanTree(300, None, None), HuffmanTree(0, None, None))
     """
-    # https://www.csestack.org/difference-between-sort-sorted-python-list-performance
-    # /#:~:text=Here%2C%20sorted()%20function%20method,
-    # or%20function%20you%20are%20using.
-    # using sorted() instead of sort() because sorted is faster
-    # the data is sorted by frequency values in
-    # increasing order at the first place
-    data = sorted(freq_dict.items(), key=lambda x: x[1])
-    # since we have to pop 2 elements from the list,
-    # the length of the data suppose to be greater than 1
-    for _ in range(len(data) - 1):
+    # https://docs.python.org/3/library/heapq.html
+    # the heap is ordered by frequency and then by the order the trees were
+    # pushed in. The symbols go in first, so a merged tree still goes after
+    # the symbols with the same frequency, and trees are never compared
+    heap = [(freq, i, HuffmanTree(symbol))
+            for i, (symbol, freq) in enumerate(freq_dict.items())]
+    heapq.heapify(heap)
+    count = len(heap)
+    while len(heap) > 1:
         # s1 and s2 are tuples, s1 <= s2
-        s1, s2 = data.pop(0), data.pop(0)
-        s = HuffmanTree(None,
-                        HuffmanTree(s1[0]) if isinstance(s1[0], int) else s1[0],
-                        HuffmanTree(s2[0]) if isinstance(s2[0], int) else s2[0])
-        freq_sum = s1[1] + s2[1]
-        # instead of using sorted() again, it is much more efficient to
-        # just find the index where the value suppose to get in to
-        lo, hi = 0, len(data)
-        while lo < hi:
-            mid = (lo + hi) // 2
-            # it is >= because the huffman tree
-            # suppose to go after symbols with same frequency
-            if freq_sum >= data[mid][1]:
-                lo = mid + 1
-            else:
-                hi = mid
-        data.insert(lo, (s, freq_sum))
-    if isinstance(data[0][0], HuffmanTree):
-        return data[0][0]
+        s1, s2 = heapq.heappop(heap), heapq.heappop(heap)
+        heapq.heappush(heap, (s1[0] + s2[0], count,
+                              HuffmanTree(None, s1[2], s2[2])))
+        count += 1
+    if not heap[0][2].is_leaf():
+        return heap[0][2]
     # when there is only one symbol in given file,
     # existing symbol must be the left value and right value can be anything
     # but left value
-    d = data[0][0]
-    # if d = 0, r = 255, if d = 255, r = 0
-    # and if d = 177, r = 178, no overlap
-    return HuffmanTree(None, HuffmanTree(d), HuffmanTree(255 - d))
+    d = heap[0][2].symbol
+    # 0, or 1 if d = 0: every alphabet starts at 0, so the dummy is a symbol
+    # of the same alphabet as d however wide it is
+    return HuffmanTree(None, HuffmanTree(d), HuffmanTree(1 if d == 0 else 0))
+
+
+def build_length_limited_tree(freq_dict: dict[int, int],
+                              max_length: int) -> HuffmanTree:
+    """ Return a tree for the frequency dictionary <freq_dict> whose codes are
+    at most <max_length> bits long, with the smallest avg_length possible
+    under that limit.
+
+    If the Huffman tree already meets the limit, it is returned as is.
+    Otherwise the code lengths come from the package-merge algorithm, and the
+    tree is the one for the canonical codes of those lengths.
+
+    Precondition: freq_dict is not empty and has at most 2 ** <max_length>
+    symbols.
+
+    >>> freq = {1: 1, 2: 1, 3: 2, 4: 3, 5: 5, 6: 8}
+    >>> max(len(c) for c in get_codes(build_huffman_tree(freq)).values())
+    5
+    >>> t = build_length_limited_tree(freq, 3)
+    >>> get_codes(t) == {5: '00', 6: '01', 1: '100', 2: '101', 3: '110', \
+    4: '111'}
+    True
+    >>> avg_length(t, freq), avg_length(build_huffman_tree(freq), freq)
+    (2.35, 2.25)
+    """
+    tree = build_huffman_tree(freq_dict)
+    if max(len(code) for code in get_codes(tree).values()) <= max_length:
+        return tree
+    if len(freq_dict) > 2 ** max_length:
+        raise ValueError(f"{len(freq_dict)} symbols do not fit in codes of "
+                         f"at most {max_length} bits")
+    # https://en.wikipedia.org/wiki/Package-merge_algorithm
+    # every item is (weight, symbols in it), and the symbols are kept in
+    # increasing order of weight, just like build_huffman_tree's ties
+    leaves = [(freq, [symbol]) for symbol, freq
+              in sorted(freq_dict.items(), key=lambda x: x[1])]
+    items = leaves
+    for _ in range(max_length - 1):
+        # package the items in pairs, and merge the packages with the leaves
+        packages = [(items[i][0] + items[i + 1][0],
+                     items[i][1] + items[i + 1][1])
+                    for i in range(0, len(items) - 1, 2)]
+        items = sorted(leaves + packages, key=lambda x: x[0])
+    # the length of a code is the number of chosen items its symbol is in
+    lengths = dict.fromkeys(freq_dict, 0)
+    for _, symbols in items[:2 * len(freq_dict) - 2]:
+        for symbol in symbols:
+            lengths[symbol] += 1
+    return _codes_to_tree(canonical_codes(lengths))
+
+
+def _codes_to_tree(codes: dict[int, str]) -> HuffmanTree:
+    """ Return the tree whose codes are <codes>.
+
+    Precondition: <codes> has at least two symbols and is a complete prefix
+    code.
+
+    >>> _codes_to_tree({3: '0', 2: '10', 9: '11'})
+    HuffmanTree(None, HuffmanTree(3, None, None), \
+HuffmanTree(None, HuffmanTree(2, None, None), HuffmanTree(9, None, None)))
+    """
+    tree = HuffmanTree(None)
+    for symbol, code in codes.items():
+        node = tree
+        for bit in code[:-1]:
+            if bit == "0":
+                node.left = node.left or HuffmanTree(None)
+                node = node.left
+            else:
+                node.right = node.right or HuffmanTree(None)
+                node = node.right
+        if code[-1] == "0":
+            node.left = HuffmanTree(symbol)
+        else:
+            node.right = HuffmanTree(symbol)
+    return tree
 
 
 def get_codes(tree: HuffmanTree) -> dict[int, str]:
@@ -121,32 +402,20 @@ def get_codes(tree: HuffmanTree) -> dict[int, str]:
     >>> c == {104: '000', 101: '001', 119: '010', 114: '011', 108: '10', 100: '110', 111: '111'}
     True
     """
-
-    # https://realpython.com/inner-functions-what-are-they-good-for/
-    # #:~:text=The%20use%20cases%20of%20Python,
-    # also%20create%20closures%20and%20decorators.
-    # inner helper function increases the efficiency
-    def _get_codes_helper(node: HuffmanTree,
-                          code: list[str], codes: dict[int, str]) -> None:
-        """
-        this method is to travel through the tree and modify dict
-        """
+    cods = {}
+    # a stack instead of recursion, so deep trees cannot hit the recursion
+    # limit. The right child goes on first so the left one comes off first,
+    # and the codes are found from left to right
+    stack = [(tree, '')]
+    while stack:
+        node, code = stack.pop()
         if node.is_leaf():
             # if it is leaf, than it is clear that
             # prefix is filled and it represents the code
-            # so join it
-            codes[node.symbol] = ''.join(code)
+            cods[node.symbol] = code
         else:
-            # it is post order
-            code.append('0')
-            _get_codes_helper(node.left, code, codes)
-            code.pop()
-            code.append('1')
-            _get_codes_helper(node.right, code, codes)
-            code.pop()
-
-    cods = {}
-    _get_codes_helper(tree, [], cods)
+            stack.append((node.right, code + '1'))
+            stack.append((node.left, code + '0'))
     return cods
 
 
@@ -165,24 +434,35 @@ def number_nodes(tree: HuffmanTree) -> None:
     >>> tree.number
     2
     """
+    # the node number starts from 0, not 1
+    count = 0
+    for node in _internal_postorder(tree):
+        node.number = count
+        count += 1
 
-    def _number_nodes_helper(t: HuffmanTree, count: int) -> int:
-        """
-        number_nodes helper function
-        """
-        # also post order
-        if t.is_leaf():
-            return 0
-        else:
-            if not t.left.is_leaf():
-                count = _number_nodes_helper(t.left, count)
-            if not t.right.is_leaf():
-                count = _number_nodes_helper(t.right, count)
-            t.number = count
-            return count + 1
 
-    # the node number starts from 0, not 1
-    _number_nodes_helper(tree, 0)
+def _internal_postorder(tree: HuffmanTree) -> list[HuffmanTree]:
+    """ Return the internal nodes of <tree> in postorder, found with a stack
+    instead of recursion.
+
+    >>> left = HuffmanTree(None, HuffmanTree(3), HuffmanTree(2))
+    >>> tree = HuffmanTree(None, left, HuffmanTree(9))
+    >>> _internal_postorder(tree) == [left, tree]
+    True
+    """
+    result = []
+    # each node is pushed before its children and comes off after them, so
+    # reversing the order they come off in gives the postorder
+    stack = [] if tree.is_leaf() else [tree]
+    while stack:
+        node = stack.pop()
+        result.append(node)
+        if not node.left.is_leaf():
+            stack.append(node.left)
+        if not node.right.is_leaf():
+            stack.append(node.right)
+    result.reverse()
+    return result
 
 
 def avg_length(tree: HuffmanTree, freq_dict: dict[int, int]) -> float:
@@ -200,22 +480,20 @@ def avg_length(tree: HuffmanTree, freq_dict: dict[int, int]) -> float:
     >>> tree = HuffmanTree(None, left, right)
     >>> avg_length(tree, freq)  # (2*2 + 7*2 + 1*1) / (2 + 7 + 1)
     1.9
+    >>> avg_length(build_huffman_tree({7: 5}), {7: 5})
+    1.0
     """
-
-    def _avg_length_helper(t: HuffmanTree, f: dict[int, int], c: int) -> int:
-        """
-        avg_length helper function
-        it returns the total number of digits
-        """
-        if t.is_leaf():
-            return f[t.symbol] * c
+    total = 0
+    stack = [(tree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node.is_leaf():
+            # the dummy leaf of a tree with one symbol is not in freq_dict
+            total += freq_dict.get(node.symbol, 0) * depth
         else:
-            result = 0
-            result += _avg_length_helper(t.left, f, c + 1)
-            result += _avg_length_helper(t.right, f, c + 1)
-        return result
-
-    return _avg_length_helper(tree, freq_dict, 0) / sum(freq_dict.values())
+            stack.append((node.left, depth + 1))
+            stack.append((node.right, depth + 1))
+    return total / sum(freq_dict.values())
 
 
 def compress_bytes(text: bytes, codes: dict[int, str]) -> bytes:
@@ -234,35 +512,514 @@ def compress_bytes(text: bytes, codes: dict[int, str]) -> bytes:
     >>> [byte_to_bits(byte) for byte in result]
     ['10111001', '10000000']
     """
+    return b"".join(_compress_chunks([text], codes))
+
+
+def _build_code_table(
+        codes: dict[int, str]) -> list[Optional[tuple[int, int]]]:
+    """ Return a table that maps every byte to the (code, length) pair for
+    its code in <codes>, where <code> is the code read as a <length>-bit
+    binary number. Bytes without a code map to None.
+
+    >>> table = _build_code_table({0: "0", 1: "10", 2: "11"})
+    >>> table[:4]
+    [(0, 1), (2, 2), (3, 2), None]
+    """
+    table = [None] * 256
+    for symbol, code in codes.items():
+        # int('', 2) fails, and a tree with one leaf has an empty code
+        table[symbol] = (int(code, 2) if code else 0, len(code))
+    return table
+
+
+def _compress_chunks(chunks: Iterable[bytes],
+                     codes: dict[int, str]) -> Iterator[bytes]:
+    """ Yield the compressed form of the concatenation of <chunks>, using the
+    mapping from <codes> for each symbol. Bits that do not fill a whole byte
+    at the end of a chunk are carried over to the next one, so the output is
+    the same no matter how the input is split.
+
+    >>> d = {0: "0", 1: "10", 2: "11"}
+    >>> chunks = _compress_chunks([bytes([1, 2]), bytes([1, 0, 2])], d)
+    >>> [bytes(chunk) for chunk in chunks]
+    [b'', b'\\xb9', b'\\x80']
+    """
     # https://realpython.com/python-bitwise-operators/
     # https://blog.finxter.com/python-bytes-vs-bytearray/
-    # using bytes are faster, so you have to change it
-    result = bytearray()
-    # first create a large line of string with all the bytes
-    bits = "".join([codes[i] for i in text])
+    table = _build_code_table(codes)
+    # every code is at most 255 bits long, so the lengths fit in a byte and
+    # translate() can count the bits of a whole chunk without a python loop
+    lengths = bytes([0 if entry is None else entry[1] for entry in table])
+    vectorised = np is not None and max(lengths) <= NUMPY_MAX_CODE_LENGTH
     buffer = 0
     count = 0
-    for bit in bits:
-        # stack up the bits
-        buffer = (buffer << 1) | (bit == "1")
-        count += 1
-        # insert byte
-        if count == 8:
-            result.append(buffer)
-            buffer = 0
-            count = 0
+    for chunk in chunks:
+        if vectorised and len(chunk) >= NUMPY_MIN_SIZE:
+            result = bytearray()
+            for start in range(0, len(chunk), CHUNK_SIZE):
+                compressed, buffer, count = _compress_numpy(
+                    chunk[start:start + CHUNK_SIZE], table, buffer, count)
+                result += compressed
+            yield result
+            continue
+        # exactly the number of whole bytes this chunk will complete
+        result = bytearray((count + sum(chunk.translate(lengths))) // 8)
+        pos = 0
+        byte = 0
+        try:
+            for byte in chunk:
+                # stack up the bits of the code at the end of the buffer
+                code, length = table[byte]
+                buffer = (buffer << length) | code
+                count += length
+                # and write them out 64 bits at a time
+                while count >= 64:
+                    count -= 64
+                    result[pos:pos + 8] = (buffer >> count).to_bytes(8,
+                                                                     "big")
+                    pos += 8
+                    buffer &= (1 << count) - 1
+        except TypeError:
+            # table[byte] is None, so <byte> has no code in <codes>
+            raise KeyError(byte) from None
+        # write the whole bytes left, the rest goes on to the next chunk
+        whole = count // 8
+        count -= whole * 8
+        result[pos:] = (buffer >> count).to_bytes(whole, "big")
+        buffer &= (1 << count) - 1
+        yield result
     # insert the remaining bits
     if count > 0:
         buffer <<= (8 - count)
-        result.append(buffer)
+        yield bytes([buffer])
+
+
+def _compress_numpy(text: bytes, table: list[Optional[tuple[int, int]]],
+                    buffer: int, count: int) -> tuple[bytes, int, int]:
+    """ Return the whole bytes of the compressed form of <text>, coded with
+    the (code, length) pairs in <table>, after the <count> bits in
+    <buffer> carried over from before, and the bits and the number of bits
+    carried over to what comes next. The output is the same as from the
+    python loop in _compress_chunks.
+
+    The codes are looked up for all of <text> at once, and a cumulative sum
+    of their lengths gives the bit each one starts at. The output is built
+    from 64-bit words: a code is at most 64 bits long, so it is split over
+    at most two of them, and the parts of the codes that start in each word
+    are or-ed together by reduceat.
+
+    Precondition: no code in <table> is longer than NUMPY_MAX_CODE_LENGTH,
+    and <count> is less than 8.
+
+    It is only called through _compress_chunks, so these examples pass with
+    or without numpy.
+
+    >>> d = {0: "0", 1: "10", 2: "11"}
+    >>> text = bytes([1, 0, 2, 2, 0]) * NUMPY_MIN_SIZE
+    >>> compress_bytes(text, d) == bytes([0b10011110]) * NUMPY_MIN_SIZE
+    True
+    >>> text = bytes([1, 0, 2]) * NUMPY_MIN_SIZE
+    >>> pieces = [text[i:i + 1000] for i in range(0, len(text), 1000)]
+    >>> compress_bytes(text, d) == b"".join(_compress_chunks(pieces, d))
+    True
+    >>> compress_bytes(bytes([1, 0, 3, 2]) * NUMPY_MIN_SIZE, d)
+    Traceback (most recent call last):
+    ...
+    KeyError: 3
+    """
+    code_table = np.array([0 if entry is None else entry[0]
+                           for entry in table], dtype=np.uint64)
+    length_table = np.array([0 if entry is None else entry[1]
+                             for entry in table], dtype=np.int64)
+    symbols = np.frombuffer(text, dtype=np.uint8)
+    # a byte without a code would be written as 0 bits, so it is the same
+    # KeyError as in the python loop instead
+    missing = np.array([entry is None for entry in table])[symbols]
+    if missing.any():
+        raise KeyError(int(symbols[missing.argmax()]))
+    # the bits carried over go first, as one more code
+    codes = np.concatenate((np.array([buffer], dtype=np.uint64),
+                            code_table[symbols]))
+    lengths = np.concatenate(([count], length_table[symbols]))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    total = int(ends[-1])
+    # how far each code goes past the end of the word it starts in, or
+    # before it if that is negative
+    over = (starts & 63) + lengths - 64
+    split = over > 0
+    # this is only 64 for a code of length 0 at the start of a word, which
+    # is 0 however far it is shifted
+    shifts = np.abs(over).astype(np.uint64)
+    first = np.where(split, codes >> shifts, codes << shifts)
+    rest = (np.uint64(64) - shifts) & np.uint64(63)
+    second = np.where(split, codes << rest, np.uint64(0))
+    words = starts >> 6
+    # the codes are in order, so those that start in the same word are next
+    # to each other, and each word starts a different run
+    runs = np.flatnonzero(np.diff(words, prepend=-1))
+    result = np.zeros(total // 64 + 2, dtype=np.uint64)
+    result[words[runs]] |= np.bitwise_or.reduceat(first, runs)
+    result[words[runs] + 1] |= np.bitwise_or.reduceat(second, runs)
+    result = result.astype(">u8").view(np.uint8)
+    whole, count = divmod(total, 8)
+    buffer = int(result[whole]) >> (8 - count) if count else 0
+    return result[:whole].tobytes(), buffer, count
+
+
+def _read_chunks(f: BinaryIO, size: int = -1,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """ Yield the rest of the open file <f>, or only its next <size> bytes if
+    <size> is not negative, <chunk_size> bytes at a time.
+    """
+    while size != 0:
+        chunk = f.read(chunk_size if size < 0 else min(size, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+        if size > 0:
+            size -= len(chunk)
+
+
+def _mapped_chunks(buf: mmap.mmap, start: int = 0) -> Iterator[bytes]:
+    """ Yield the bytes of the memory-mapped file <buf> from <start> on,
+    CHUNK_SIZE bytes at a time.
+    """
+    for i in range(start, len(buf), CHUNK_SIZE):
+        yield buf[i:i + CHUNK_SIZE]
+
+
+def pool_map(function: Callable[[Any], Any], items: Iterable[Any],
+             workers: int) -> Iterator[Any]:
+    """ Yield <function> applied to each of <items>, in order.
+
+    If <workers> is more than 1, the calls are made by a pool of <workers>
+    processes. At most two calls per process are waiting at any time, so
+    <items> is only read as fast as the results are used.
+
+    >>> list(pool_map(abs, [-1, 2, -3], 1))
+    [1, 2, 3]
+    """
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def choose_digrams(text: bytes, limit: int = MAX_DIGRAMS) -> list[bytes]:
+    """ Return up to <limit> of the pairs of bytes that occur most often in
+    <text>, most frequent first. Pairs that occur fewer than
+    DIGRAM_MIN_COUNT times are left out.
+
+    >>> choose_digrams(b"ab" * 40 + b"cd" * 35 + b"ef" * 5)
+    [b'ab', b'ba', b'cd', b'dc']
+    >>> choose_digrams(b"ab" * 40 + b"cd" * 35, 1)
+    [b'ab']
+    """
+    pairs = Counter(zip(text, text[1:]))
+    return [bytes(pair) for pair, count in pairs.most_common(limit)
+            if count >= DIGRAM_MIN_COUNT]
+
+
+def split_digrams(text: bytes, digrams: list[bytes]) -> list[int]:
+    """ Return the symbols of <text>, read from left to right, where the
+    pair of bytes <digrams>[i] is the symbol 256 + i wherever it starts at
+    the next byte, and any other byte is its own symbol.
+
+    >>> split_digrams(b"aabab", [b"ab"])
+    [97, 256, 256]
+    >>> split_digrams(b"abc", [b"bc", b"ab"])
+    [257, 99]
+    """
+    symbols = {bytes([byte]): byte for byte in range(256)}
+    symbols.update({pair: 256 + i for i, pair in enumerate(digrams)})
+    # the same split as a loop over the bytes, but done in C by a regular
+    # expression: a pair if one starts here, or else a single byte. Putting
+    # the pairs with the same first byte in one character class is about
+    # twice as fast as one alternative per pair
+    seconds = {}
+    for pair in digrams:
+        seconds.setdefault(pair[:1], []).append(re.escape(pair[1:]))
+    pattern = re.compile(b"|".join(
+        [re.escape(first) + b"[" + b"".join(second) + b"]"
+         for first, second in seconds.items()] + [b"."]), re.DOTALL)
+    return [symbols[token] for token in pattern.findall(text)]
+
+
+def _code_pairs(codes: dict[int, str]) -> dict[int, tuple[int, int]]:
+    """ Return a dictionary which maps each symbol in <codes> to the
+    (code, length) pair for its code, where <code> is the code read as a
+    <length>-bit binary number. Unlike _build_code_table, the symbols may be
+    more than 255.
+
+    >>> _code_pairs({0: "0", 300: "10", 2: "11"})
+    {0: (0, 1), 300: (2, 2), 2: (3, 2)}
+    """
+    # int('', 2) fails, and a tree with one leaf has an empty code
+    return {symbol: (int(code, 2) if code else 0, len(code))
+            for symbol, code in codes.items()}
+
+
+def _compress_symbols(pairs: Iterable[tuple[int, int]]) -> bytes:
+    """ Return the bits of the (code, length) <pairs>, as from _code_pairs,
+    one after the other, with the last byte padded with zeros. This is the
+    bit writer of every mode whose symbols are not just bytes.
+
+    >>> pairs = _code_pairs({0: "0", 300: "10", 2: "11"})
+    >>> result = _compress_symbols(map(pairs.get, [300, 2, 300, 0, 2]))
+    >>> [byte_to_bits(byte) for byte in result]
+    ['10111001', '10000000']
+    """
+    result = bytearray()
+    buffer = 0
+    count = 0
+    for code, length in pairs:
+        buffer = (buffer << length) | code
+        count += length
+        if count >= 32:
+            # write out every whole byte, the rest stays in the buffer
+            rest = count & 7
+            result += (buffer >> rest).to_bytes(count >> 3, "big")
+            buffer &= (1 << rest) - 1
+            count = rest
+    if count > 0:
+        # pad the last bits out to whole bytes
+        result += (buffer << (-count % 8)).to_bytes(-(-count // 8), "big")
     return bytes(result)
 
 
-def tree_to_bytes(tree: HuffmanTree) -> bytes:
+def build_context_model(text: bytes) \
+        -> tuple[list[dict[int, str]], list[int]]:
+    """ Return the code tables of an order-1 model of <text>, and the index
+    of the table used after each byte. The first byte of <text> is coded
+    as if it came after a 0 byte.
+
+    A byte gets its own table if that saves more bits than the table takes
+    up in the header, compared to the codes of build_huffman_tree for all
+    of <text>. The bytes after every other byte share the first table.
+    The codes are canonical.
+
+    >>> tables, contexts = build_context_model(b"abc" * 100)
+    >>> tables
+    [{97: '0', 99: '1'}, {0: '0', 98: '1'}, {0: '0', 97: '1'}]
+    >>> contexts[0], contexts[97], contexts[98], contexts[99]
+    (0, 1, 0, 2)
+    """
+    following = {}
+    for (previous, byte), count in Counter(zip(bytes(1) + text,
+                                               text)).items():
+        following.setdefault(previous, {})[byte] = count
+    overall = get_codes(build_huffman_tree(build_frequency_dict(text)))
+    shared = {}
+    own = {}
+    for previous, freq in sorted(following.items()):
+        codes = get_codes(build_huffman_tree(freq))
+        # the table takes a symbol and a length per code in the header
+        saved = sum(count * (len(overall[byte]) - len(codes[byte]))
+                    for byte, count in freq.items()) - 16 * len(codes)
+        if saved > 0:
+            own[previous] = codes
+        else:
+            for byte, count in freq.items():
+                shared[byte] = shared.get(byte, 0) + count
+    tables = [get_codes(build_huffman_tree(shared)) if shared else {}]
+    contexts = [0] * 256
+    for previous, codes in own.items():
+        contexts[previous] = len(tables)
+        tables.append(codes)
+    return [canonical_codes({symbol: len(code)
+                             for symbol, code in codes.items()})
+            for codes in tables], contexts
+
+
+def _compress_context(text: bytes, tables: list[dict[int, str]],
+                      contexts: list[int]) -> bytes:
+    """ Return the compressed form of <text> under the order-1 model with
+    <tables> and <contexts>, as returned by build_context_model.
+
+    >>> tables = [{0: "0", 1: "1"}, {0: "1", 1: "0"}]
+    >>> contexts = [0, 1] + [0] * 254
+    >>> [byte_to_bits(byte) for byte in _compress_context(bytes([1, 1, 0]),
+    ...                                                   tables, contexts)]
+    ['10100000']
+    """
+    # the (code, length) pair of every byte after every byte
+    table = [None] * (1 << 16)
+    for previous, index in enumerate(contexts):
+        for symbol, pair in _code_pairs(tables[index]).items():
+            table[(previous << 8) | symbol] = pair
+    return _compress_symbols(table[(previous << 8) | byte] for previous, byte
+                             in zip(bytes(1) + text, text))
+
+
+def context_model_to_bytes(tables: list[dict[int, str]],
+                           contexts: list[int]) -> bytes:
+    """ Return a bytes representation of the order-1 model with <tables> and
+    <contexts>, as returned by build_context_model.
+
+    A 32-byte bitmap of the bytes that have tables of their own comes first.
+    Then each table, the shared one first, is stored as the number of codes
+    in 2 bytes, the symbols of the codes and the lengths of the codes.
+
+    >>> contexts = [0, 1] + [0] * 254
+    >>> buf = context_model_to_bytes([{}, {0: "0", 1: "1"}], contexts)
+    >>> list(buf[:4]), list(buf[32:])
+    ([2, 0, 0, 0], [0, 0, 2, 0, 0, 1, 1, 1])
+    """
+    bitmap = bytearray(32)
+    for previous, index in enumerate(contexts):
+        if index:
+            bitmap[previous // 8] |= 1 << (previous % 8)
+    result = [bytes(bitmap)]
+    for codes in tables:
+        result.append(len(codes).to_bytes(2, "little") + bytes(codes)
+                      + bytes([len(code) for code in codes.values()]))
+    return b"".join(result)
+
+
+def _lz77_codes(tokens: list[Union[int, tuple[int, int]]]) \
+        -> tuple[dict[int, str], dict[int, str]]:
+    """ Return the canonical codes for the literals and lengths, and for the
+    distances, of <tokens> from lz77_tokens. A length or distance is coded by
+    its code from _lz77_bucket, and the length codes come after the 256
+    literals.
+
+    >>> _lz77_codes([97, (4, 1)])
+    ({97: '0', 257: '1'}, {0: '0', 1: '1'})
+    """
+    literals = Counter()
+    distances = Counter()
+    for token in tokens:
+        if isinstance(token, int):
+            literals[token] += 1
+        else:
+            literals[256 + lz77_bucket(token[0] - LZ77_MIN_MATCH)[0]] += 1
+            distances[lz77_bucket(token[1] - 1)[0]] += 1
+    return _peek_codes(literals), _peek_codes(distances)
+
+
+def _peek_codes(freq: dict[int, int]) -> dict[int, str]:
+    """ Return canonical codes for the symbols in <freq>, which are at most
+    PEEK_CODE_LENGTH bits long, or no codes if <freq> is empty.
+
+    >>> _peek_codes({300: 1})
+    {0: '0', 300: '1'}
+    """
+    if not freq:
+        return {}
+    codes = get_codes(build_length_limited_tree(freq, PEEK_CODE_LENGTH))
+    return canonical_codes({symbol: len(code)
+                            for symbol, code in codes.items()})
+
+
+def _compress_lz77(tokens: list[Union[int, tuple[int, int]]],
+                   literals: dict[int, str],
+                   distances: dict[int, str]) -> bytes:
+    """ Return the compressed form of <tokens> from lz77_tokens, with the
+    codes <literals> for the literals and lengths and <distances> for the
+    distances. A match is the code of its length, the extra bits of the
+    length, the code of its distance and the extra bits of the distance.
+
+    >>> literals = {97: "0", 256: "10", 257: "11"}
+    >>> [byte_to_bits(byte) for byte in _compress_lz77([97, (4, 1)],
+    ...                                                literals, {0: "0"})]
+    ['01100000']
+    >>> [byte_to_bits(byte) for byte in _compress_lz77([(9, 6)], {261: "1"},
+    ...                                                {4: "01"})]
+    ['10011000']
+    """
+    # the bits and their number for each literal, and for each length and
+    # distance of a match, codes and extra bits together
+    pairs = _code_pairs(literals)
+    literal_bits = [pairs.get(symbol, (0, 0)) for symbol in range(256)]
+    length_bits = [(0, 0)] * LZ77_MIN_MATCH
+    for length in range(LZ77_MIN_MATCH, LZ77_MAX_MATCH + 1):
+        code, extra, bits = lz77_bucket(length - LZ77_MIN_MATCH)
+        if 256 + code in literals:
+            huffman = literals[256 + code]
+            length_bits.append(((int(huffman, 2) << extra) | bits,
+                                len(huffman) + extra))
+        else:
+            length_bits.append((0, 0))
+    distance_bits = [(0, 0)]
+    for distance in range(1, LZ77_WINDOW):
+        code, extra, bits = lz77_bucket(distance - 1)
+        huffman = distances.get(code, "")
+        distance_bits.append((((int(huffman, 2) if huffman else 0) << extra)
+                              | bits, len(huffman) + extra))
+    return _compress_symbols(
+        pair for token in tokens for pair in
+        ((literal_bits[token],) if isinstance(token, int)
+         else (length_bits[token[0]], distance_bits[token[1]])))
+
+
+def _compress_lz77_block(job: tuple[bytes, bytes], level: int) -> bytes:
+    """ Return the compressed form of a block in a FLAG_LZ77 file, where
+    <job> is the LZ77_WINDOW bytes before the block and the block: the
+    number of bytes after the first 4 in 4 bytes, the size of the block in
+    4 bytes, the lengths of the codes of the 256 + LZ77_LENGTH_CODES
+    literals and lengths and then of the LZ77_DISTANCE_CODES distances, one
+    byte each, and the bits from _compress_lz77 of the tokens that
+    lz77_tokens finds in the block at <level>.
+    """
+    history, block = job
+    tokens = lz77_tokens(history + block, level, len(history))
+    literals, distances = _lz77_codes(tokens)
+    lengths = bytearray(256 + LZ77_LENGTH_CODES + LZ77_DISTANCE_CODES)
+    for symbol, code in literals.items():
+        lengths[symbol] = len(code)
+    for symbol, code in distances.items():
+        lengths[256 + LZ77_LENGTH_CODES + symbol] = len(code)
+    result = (int32_to_bytes(len(block)) + bytes(lengths)
+              + _compress_lz77(tokens, literals, distances))
+    return int32_to_bytes(len(result)) + result
+
+
+def _with_history(blocks: Iterable[bytes]) -> Iterator[tuple[bytes, bytes]]:
+    """ Yield each of <blocks> after the LZ77_WINDOW bytes before it, or all
+    of the bytes before it if there are fewer.
+
+    >>> list(_with_history([b"ab", b"cd"]))
+    [(b'', b'ab'), (b'ab', b'cd')]
+    """
+    history = b""
+    for block in blocks:
+        yield history, block
+        history = (history + block)[-LZ77_WINDOW:]
+
+
+def _compress_bwt_block(block: bytes) -> bytes:
+    """ Return the compressed form of <block> in a FLAG_BWT file: the number
+    of bytes after the first 4 in 4 bytes, the size of <block> and the index
+    from bwt_transform in 4 bytes each, the lengths of the codes of the
+    BWT_SYMBOLS symbols, one byte each, and the codes of zero_runs of the
+    move_to_front ranks of the transform.
+    """
+    last, index = bwt_transform(block)
+    symbols = zero_runs(move_to_front(last))
+    codes = _peek_codes(Counter(symbols))
+    lengths = bytearray(BWT_SYMBOLS)
+    for symbol, code in codes.items():
+        lengths[symbol] = len(code)
+    result = (int32_to_bytes(len(block)) + int32_to_bytes(index)
+              + bytes(lengths)
+              + _compress_symbols(map(_code_pairs(codes).get, symbols)))
+    return int32_to_bytes(len(result)) + result
+
+
+def tree_to_bytes(tree: HuffmanTree, width: int = 1) -> bytes:
     """
     Return a bytes representation of the Huffman tree <tree>.
     The representation should be based on the postorder traversal of the tree's
-    internal nodes, starting from 0.
+    internal nodes, starting from 0. Node numbers and symbols take <width>
+    bytes each, little-endian.
 
     Precondition: <tree> has its nodes numbered.
 
@@ -284,45 +1041,864 @@ def tree_to_bytes(tree: HuffmanTree) -> bytes:
             #doctest: +NORMALIZE_WHITESPACE
     [0, 104, 0, 101, 0, 119, 0, 114, 1, 0, 1, 1, 0, 100, 0, 111, 0, 108,\
     1, 3, 1, 2, 1, 4]
+    >>> tree = HuffmanTree(None, HuffmanTree(300), HuffmanTree(2))
+    >>> number_nodes(tree)
+    >>> list(tree_to_bytes(tree, 2))
+    [0, 44, 1, 0, 2, 0]
     """
-    # post order
-    if not tree.is_leaf():
-        result = b''
-        if not tree.left.is_leaf():
-            result += tree_to_bytes(tree.left)
-        if not tree.right.is_leaf():
-            result += tree_to_bytes(tree.right)
-        b_1 = bytes([1]) if not tree.left.is_leaf() else bytes([0])
-        b_2 = bytes([tree.left.number]) \
-            if not tree.left.is_leaf() else bytes([tree.left.symbol])
-        b_3 = bytes([1]) if not tree.right.is_leaf() else bytes([0])
-        b_4 = bytes([tree.right.number]) \
-            if not tree.right.is_leaf() else bytes([tree.right.symbol])
-        result += (b_1 + b_2 + b_3 + b_4)
-        return result
-    else:
+    if tree.is_leaf():
         return b'0'
+    # post order
+    result = []
+    for node in _internal_postorder(tree):
+        for child in (node.left, node.right):
+            if child.is_leaf():
+                result.append(bytes([0]) + child.symbol.to_bytes(width,
+                                                                 "little"))
+            else:
+                result.append(bytes([1]) + child.number.to_bytes(width,
+                                                                 "little"))
+    return b''.join(result)
+
+
+def canonical_codes(lengths: dict[int, int]) -> dict[int, str]:
+    """ Return the canonical Huffman codes for the code lengths in <lengths>,
+    which maps each symbol to the length of its code.
+
+    Shorter codes come first, and codes of the same length go to their
+    symbols in increasing order. Each code is the one before it plus one,
+    shifted left when the length grows, so the lengths alone are enough to
+    rebuild every code.
+
+    >>> canonical_codes({3: 1, 2: 1})
+    {2: '0', 3: '1'}
+    >>> d = canonical_codes({104: 3, 101: 3, 119: 3, 114: 3, 108: 2, 100: 3, \
+    111: 3})
+    >>> d == {108: '00', 100: '010', 101: '011', 104: '100', 111: '101', \
+    114: '110', 119: '111'}
+    True
+    """
+    codes = {}
+    code = 0
+    previous = 0
+    for symbol, length in sorted(lengths.items(), key=lambda x: (x[1], x[0])):
+        code <<= length - previous
+        codes[symbol] = format(code, "b").zfill(length) if length else ""
+        code += 1
+        previous = length
+    return codes
+
+
+def lengths_to_bytes(codes: dict[int, str]) -> bytes:
+    """ Return a bytes representation of the lengths of the codes in <codes>:
+    256 bytes, one for every possible symbol, each holding the length of that
+    symbol's code or 0 if it has none.
+
+    A code is at most 255 bits long, since a tree with 256 leaves is at most
+    255 levels deep, so every length fits in one byte.
+
+    >>> list(lengths_to_bytes({0: "1", 3: "01", 2: "00"})[:5])
+    [1, 0, 2, 2, 0]
+    """
+    result = bytearray(256)
+    for symbol, code in codes.items():
+        result[symbol] = len(code)
+    return bytes(result)
+
 
+def bytes_to_lengths(buf: bytes) -> dict[int, int]:
+    """ Return the dictionary of code lengths represented by the 256 bytes in
+    <buf>, leaving out the symbols with no code.
 
-def compress_file(in_file: str, out_file: str) -> None:
+    >>> bytes_to_lengths(bytes([1, 0, 2, 2]) + bytes(252))
+    {0: 1, 2: 2, 3: 2}
+    """
+    return {symbol: length for symbol, length in enumerate(buf) if length}
+
+
+def _no_metrics(name: str, value: float) -> None:
+    """ Ignore the metric <name> with value <value>.
+    """
+
+
+@contextmanager
+def _timed(metrics: Callable[[str, float], None],
+           stage: str) -> Iterator[None]:
+    """ Pass the number of seconds the body of the with statement takes to
+    <metrics>, as the metric "<stage>_seconds".
+    """
+    start = time.perf_counter()
+    yield
+    metrics(stage + "_seconds", time.perf_counter() - start)
+
+
+def compress_file(in_file: str, out_file: str, stream: bool = False,
+                  canonical: bool = False, workers: int = 1,
+                  blocks: bool = False, mapped: bool = False,
+                  sync_interval: int = 0, max_code_length: int = 0,
+                  adaptive: bool = False, legacy: bool = False,
+                  digrams: bool = False, context: bool = False,
+                  dictionary: Optional[str] = None, lz77: int = 0,
+                  bwt: bool = False, filters: bool = False,
+                  metrics: Callable[[str, float], None] = _no_metrics) -> None:
     """ Compress contents of the file <in_file> and store results in <out_file>.
     Both <in_file> and <out_file> are string objects representing the names of
     the input and output files.
 
-    Precondition: The contents of the file <in_file> are not empty.
+    By default the output is a FRAMED file with a single Huffman tree. At
+    most one of these modes can replace that tree: <blocks> gives each block
+    of BLOCK_SIZE bytes its own tree, <adaptive> uses adaptive Huffman codes
+    and reads <in_file> only once, <dictionary> uses the codes of a file made
+    by train_dictionary, <digrams> codes frequent pairs of bytes as one
+    symbol, <context> uses the order-1 model of build_context_model, <lz77>
+    is a level from 1 to 9 of lz77_tokens, <bwt> uses bwt_transform and
+    <filters> uses the prediction filters of choose_filters.
+
+    The other options only apply to the single tree: <stream> reads
+    <in_file> twice, CHUNK_SIZE bytes at a time, <mapped> memory-maps both
+    files, <canonical> stores canonical code lengths instead of the tree,
+    <sync_interval> stores a sync point for decompress_range every that many
+    bytes, <max_code_length> limits the length of the codes, and <legacy>
+    writes the formats from before FRAMED, which cannot hold 4 GB or more.
+    <digrams> also takes <max_code_length>, and <filters> takes <canonical>
+    and <max_code_length>. <stream>, <blocks>, <lz77> and <bwt> use up to
+    <workers> processes.
+
+    A ValueError is raised for options that cannot be used together, as
+    listed in MODE_OPTIONS and OPTION_CONFLICTS, and if <lz77> is not 0 or a
+    level from 1 to 9, before either file is opened.
+
+    >>> compress_file("in", "out", lz77=6, bwt=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: lz77 and bwt cannot be used together
+    >>> compress_file("in", "out", adaptive=True, canonical=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: adaptive cannot be used with canonical
+    >>> compress_file("in", "out", stream=True, mapped=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: stream and mapped cannot be used together
+    >>> compress_file("in", "out", lz77=10)
+    Traceback (most recent call last):
+    ...
+    ValueError: LZ77 level 10 is not from 1 to 9
+
+    An empty <in_file> has no symbols to build codes from, so whatever the
+    options, it is written as just the header of a FRAMED file with a size
+    of 0 and no codes.
+
+    <metrics> is called with the name and value of each measurement taken
+    along the way: the time in seconds each stage takes, as "<stage>_seconds"
+    for stages such as "count", "build_tree" and "encode", and
+    "bits_per_symbol", "input_bytes", "header_bytes" and "output_bytes".
+    The modes that build their codes while encoding only time "encode".
+
+    >>> import tempfile
+    >>> measured = {}
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(b"helloworld")
+    ...     compress_file(tmp + "/in", tmp + "/out", legacy=True,
+    ...                   metrics=measured.__setitem__)
+    Bits per symbol: 2.7
+    >>> measured["input_bytes"], measured["header_bytes"]
+    (10, 29)
+    >>> measured["output_bytes"]
+    33
+    >>> sorted(name for name in measured if name.endswith("_seconds"))
+    ['build_tree_seconds', 'count_seconds', 'encode_seconds', \
+'get_codes_seconds', 'header_seconds', 'number_nodes_seconds']
     """
+    if lz77 != 0 and not 1 <= lz77 < len(LZ77_LEVELS):
+        raise ValueError(f"LZ77 level {lz77} is not from 1 to "
+                         f"{len(LZ77_LEVELS) - 1}")
+    _check_options({"blocks": blocks, "adaptive": adaptive,
+                    "dictionary": dictionary is not None,
+                    "digrams": digrams, "context": context,
+                    "lz77": lz77 != 0, "bwt": bwt, "filters": filters,
+                    "stream": stream, "mapped": mapped,
+                    "canonical": canonical,
+                    "sync_interval": sync_interval > 0,
+                    "max_code_length": max_code_length > 0,
+                    "legacy": legacy})
+    # a pipe also has a size of 0, but it can only be read to find out if
+    # it is empty
+    if os.path.isfile(in_file) and os.path.getsize(in_file) == 0:
+        header = MAGIC + bytes([VERSION, 0]) + bytes(8)
+        with open(out_file, "wb") as f2:
+            f2.write(header)
+        metrics("input_bytes", 0)
+        metrics("header_bytes", len(header))
+        metrics("output_bytes", len(header))
+        return
+    if dictionary is not None:
+        with _timed(metrics, "encode"):
+            with open(in_file, "rb") as f1:
+                text = f1.read()
+            dictionary_id, lengths = load_dictionary(dictionary)
+            codes = _dictionary_codes(dictionary_id, lengths)
+            header = (bytes([0, SHARED]) + int32_to_bytes(dictionary_id)
+                      + _varint_to_bytes(len(text)))
+            with open(out_file, "wb") as f2:
+                f2.write(header)
+                f2.write(compress_bytes(text, codes))
+        bits = sum(count * len(codes[byte])
+                   for byte, count in Counter(text).items())
+        print("Bits per symbol:", bits / len(text))
+        metrics("bits_per_symbol", bits / len(text))
+        metrics("input_bytes", len(text))
+        metrics("header_bytes", len(header))
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if adaptive:
+        with _timed(metrics, "encode"), open(in_file, "rb") as f1, \
+                open(out_file, "wb") as f2:
+            f2.write(bytes([0, ADAPTIVE]))
+            size = adaptive_compress(f1, f2)
+            print("Bits per symbol:", 8 * (f2.tell() - 2) / size)
+            metrics("bits_per_symbol", 8 * (f2.tell() - 2) / size)
+            metrics("input_bytes", size)
+            metrics("output_bytes", f2.tell())
+        return
+    if blocks:
+        with _timed(metrics, "encode"):
+            _compress_blocks(in_file, out_file, workers)
+        metrics("bits_per_symbol", 8 * os.path.getsize(out_file)
+                / os.path.getsize(in_file))
+        metrics("input_bytes", os.path.getsize(in_file))
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if digrams:
+        with open(in_file, "rb") as f1:
+            text = f1.read()
+        _compress_digrams(text, out_file, max_code_length, metrics)
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if context:
+        with open(in_file, "rb") as f1:
+            text = f1.read()
+        _compress_context_file(text, out_file, metrics)
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if lz77 != 0:
+        with _timed(metrics, "encode"):
+            size = _compress_lz77_file(in_file, out_file, lz77, workers)
+        print("Bits per symbol:", 8 * os.path.getsize(out_file) / size)
+        metrics("bits_per_symbol", 8 * os.path.getsize(out_file) / size)
+        metrics("input_bytes", size)
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if bwt:
+        with _timed(metrics, "encode"), open(in_file, "rb") as f1, \
+                open(out_file, "wb") as f2:
+            size = os.fstat(f1.fileno()).st_size
+            f2.write(MAGIC + bytes([VERSION, FLAG_BWT])
+                     + size.to_bytes(8, "little"))
+            for block in pool_map(_compress_bwt_block,
+                                  _read_chunks(f1, chunk_size=BWT_BLOCK_SIZE),
+                                  workers):
+                f2.write(block)
+        print("Bits per symbol:", 8 * os.path.getsize(out_file) / size)
+        metrics("bits_per_symbol", 8 * os.path.getsize(out_file) / size)
+        metrics("input_bytes", size)
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
+    if filters:
+        with open(in_file, "rb") as f1:
+            text = f1.read()
+        _compress_filtered(text, out_file, canonical, max_code_length,
+                           metrics)
+        metrics("output_bytes", os.path.getsize(out_file))
+        return
     with open(in_file, "rb") as f1:
-        text = f1.read()
+        with _timed(metrics, "count"):
+            if stream:
+                freq = build_file_frequency_dict(in_file, workers)
+                size = sum(freq.values())
+            elif mapped:
+                text = mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ)
+                freq, size = build_frequency_dict(text), len(text)
+            else:
+                text = f1.read()
+                freq, size = build_frequency_dict(text), len(text)
+        with _timed(metrics, "build_tree"):
+            tree = build_huffman_tree(freq)
+            bits_per_symbol = avg_length(tree, freq)
+            if max_code_length > 0:
+                tree = build_length_limited_tree(freq, max_code_length)
+                print("Cost of the code length limit:",
+                      avg_length(tree, freq) - bits_per_symbol)
+                bits_per_symbol = avg_length(tree, freq)
+        with _timed(metrics, "get_codes"):
+            codes = get_codes(tree)
+        print("Bits per symbol:", bits_per_symbol)
+        metrics("bits_per_symbol", bits_per_symbol)
+        points = b""
+        if sync_interval > 0:
+            with _timed(metrics, "sync_points"):
+                if stream:
+                    f1.seek(0)
+                    chunks = _read_chunks(f1)
+                else:
+                    chunks = _mapped_chunks(text) if mapped else [text]
+                # the sync points only depend on the code lengths, so they
+                # stay the same if the codes are made canonical
+                points = b"".join([point.to_bytes(8, "little") for point in
+                                   _sync_points(chunks, codes, sync_interval)])
+        if not canonical:
+            with _timed(metrics, "number_nodes"):
+                number_nodes(tree)
+        with _timed(metrics, "header"):
+            header = _header(tree, codes, size, canonical, legacy,
+                             sync_interval, points)
+        metrics("input_bytes", size)
+        metrics("header_bytes", len(header))
+        if canonical:
+            codes = canonical_codes({symbol: len(code)
+                                     for symbol, code in codes.items()})
+        with _timed(metrics, "encode"):
+            if mapped:
+                with text:
+                    _compress_mapped(text, out_file, header, codes, freq)
+            else:
+                with open(out_file, "wb") as f2:
+                    f2.write(header)
+                    if stream:
+                        # second pass over the same file handle
+                        f1.seek(0)
+                        for compressed in _compress_chunks(_read_chunks(f1),
+                                                           codes):
+                            f2.write(compressed)
+                    else:
+                        f2.write(compress_bytes(text, codes))
+    metrics("output_bytes", os.path.getsize(out_file))
+
+
+def _check_options(used: dict[str, bool]) -> None:
+    """ Raise a ValueError if the options of compress_file that are True in
+    <used> cannot be used together.
+
+    >>> _check_options({"lz77": True, "bwt": False, "canonical": False})
+    >>> _check_options({"lz77": True, "bwt": True})
+    Traceback (most recent call last):
+    ...
+    ValueError: lz77 and bwt cannot be used together
+    >>> _check_options({"blocks": True, "canonical": True})
+    Traceback (most recent call last):
+    ...
+    ValueError: blocks cannot be used with canonical
+    """
+    chosen = [name for name, value in used.items() if value]
+    modes = [name for name in chosen if name in MODE_OPTIONS]
+    if len(modes) > 1:
+        raise ValueError(f"{modes[0]} and {modes[1]} cannot be used together")
+    for mode in modes:
+        for name in chosen:
+            if name != mode and name not in MODE_OPTIONS[mode]:
+                raise ValueError(f"{mode} cannot be used with {name}")
+    for conflict in OPTION_CONFLICTS:
+        if all(used.get(name, False) for name in conflict):
+            raise ValueError(", ".join(conflict[:-1]) + " and "
+                             + conflict[-1] + " cannot be used together")
+
+
+def _header(tree: HuffmanTree, codes: dict[int, str], size: int,
+            canonical: bool, legacy: bool, sync_interval: int,
+            points: bytes, flags: int = 0) -> bytes:
+    """ Return the header of a file of <size> bytes compressed with <codes>,
+    which are the codes of <tree>, as described in compress_file. <points>
+    are the sync points, 8 bytes each, if <sync_interval> is more than 0.
+    A FRAMED file also gets the feature <flags>.
+
+    Precondition: the nodes of <tree> are numbered, unless <canonical> is
+    True.
+    """
+    if canonical:
+        table = lengths_to_bytes(codes)
+    else:
+        table = tree.num_nodes_to_bytes() + tree_to_bytes(tree)
+    if not legacy:
+        flags |= ((FLAG_CANONICAL if canonical else 0)
+                  | (FLAG_INDEXED if sync_interval > 0 else 0))
+        header = (MAGIC + bytes([VERSION, flags])
+                  + size.to_bytes(8, "little") + table)
+        if sync_interval > 0:
+            header += sync_interval.to_bytes(8, "little") + points
+        return header
+    if sync_interval > 0:
+        return (bytes([0, INDEXED]) + table + int32_to_bytes(size)
+                + int32_to_bytes(sync_interval) + points)
+    if canonical:
+        return bytes([0, CANONICAL]) + table + int32_to_bytes(size)
+    return table + int32_to_bytes(size)
+
+
+def _huffman_cost(text: bytes) -> float:
+    """ Return the avg_length of the Huffman tree for the bytes of <text>,
+    which is how choose_filters compares the filters.
+
+    >>> _huffman_cost(b"aaab")
+    1.0
+    """
     freq = build_frequency_dict(text)
+    return avg_length(build_huffman_tree(freq), freq)
+
+
+def _compress_filtered(text: bytes, out_file: str, canonical: bool,
+                       max_code_length: int,
+                       metrics: Callable[[str, float], None]) -> None:
+    """ Write <text> to <out_file> as a FRAMED file of the bytes filtered by
+    choose_filters, coded with canonical codes if <canonical> is True, and
+    with no code longer than <max_code_length> bits if that is more than 0.
+    <metrics> gets the same measurements as from compress_file.
+
+    After the codes, the header holds FILTER_BLOCK_SIZE, the number of
+    bytes per row, and the number of blocks, in 4 bytes each, and then the
+    choice of filter for each block, in one byte each.
+    """
+    with _timed(metrics, "filter"):
+        filtered, choices = choose_filters(text, *bitmap_layout(text),
+                                           _huffman_cost)
+    with _timed(metrics, "count"):
+        freq = build_frequency_dict(filtered)
+    with _timed(metrics, "build_tree"):
+        if max_code_length > 0:
+            tree = build_length_limited_tree(freq, max_code_length)
+        else:
+            tree = build_huffman_tree(freq)
+    with _timed(metrics, "get_codes"):
+        codes = get_codes(tree)
+    print("Bits per symbol:", avg_length(tree, freq))
+    metrics("bits_per_symbol", avg_length(tree, freq))
+    if not canonical:
+        with _timed(metrics, "number_nodes"):
+            number_nodes(tree)
+    with _timed(metrics, "header"):
+        header = (_header(tree, codes, len(text), canonical, False, 0, b"",
+                          FLAG_FILTERS)
+                  + int32_to_bytes(FILTER_BLOCK_SIZE)
+                  + int32_to_bytes(bitmap_layout(text)[1])
+                  + int32_to_bytes(len(choices)) + choices)
+    metrics("input_bytes", len(text))
+    metrics("header_bytes", len(header))
+    if canonical:
+        codes = canonical_codes({symbol: len(code)
+                                 for symbol, code in codes.items()})
+    with _timed(metrics, "encode"), open(out_file, "wb") as f:
+        f.write(header)
+        f.write(compress_bytes(filtered, codes))
+
+
+def _compress_digrams(text: bytes, out_file: str, max_code_length: int,
+                      metrics: Callable[[str, float], None]) -> None:
+    """ Write <text> to <out_file> as a FRAMED file in which the pairs of
+    bytes chosen by choose_digrams have symbols of their own, and no code is
+    longer than <max_code_length> bits if that is more than 0. <metrics>
+    gets the same measurements as from compress_file.
+
+    After the original size, the header holds the number of internal nodes
+    of the tree in 2 bytes, the tree as written by tree_to_bytes with a
+    width of 2, the number of pairs in 2 bytes and then the pairs.
+    """
+    with _timed(metrics, "count"):
+        pairs = choose_digrams(text)
+        symbols = split_digrams(text, pairs)
+        freq = dict(Counter(symbols))
+    with _timed(metrics, "build_tree"):
+        if max_code_length > 0:
+            tree = build_length_limited_tree(freq, max_code_length)
+        else:
+            tree = build_huffman_tree(freq)
+    with _timed(metrics, "get_codes"):
+        codes = get_codes(tree)
+    bits = sum(count * len(codes[symbol]) for symbol, count in freq.items())
+    print("Bits per symbol:", bits / len(text))
+    metrics("bits_per_symbol", bits / len(text))
+    with _timed(metrics, "number_nodes"):
+        number_nodes(tree)
+    with _timed(metrics, "header"):
+        header = (MAGIC + bytes([VERSION, FLAG_DIGRAMS])
+                  + len(text).to_bytes(8, "little")
+                  + (tree.number + 1).to_bytes(2, "little")
+                  + tree_to_bytes(tree, 2)
+                  + len(pairs).to_bytes(2, "little") + b"".join(pairs))
+    metrics("input_bytes", len(text))
+    metrics("header_bytes", len(header))
+    with _timed(metrics, "encode"), open(out_file, "wb") as f:
+        f.write(header)
+        f.write(_compress_symbols(map(_code_pairs(codes).get, symbols)))
+
+
+def _compress_context_file(text: bytes, out_file: str,
+                           metrics: Callable[[str, float], None]) -> None:
+    """ Write <text> to <out_file> as a FRAMED file coded with the order-1
+    model from build_context_model, which is stored after the original size
+    by context_model_to_bytes. <metrics> gets the same measurements as from
+    compress_file.
+    """
+    with _timed(metrics, "build_tree"):
+        tables, contexts = build_context_model(text)
+    with _timed(metrics, "header"):
+        header = (MAGIC + bytes([VERSION, FLAG_CONTEXT])
+                  + len(text).to_bytes(8, "little")
+                  + context_model_to_bytes(tables, contexts))
+    metrics("input_bytes", len(text))
+    metrics("header_bytes", len(header))
+    with _timed(metrics, "encode"):
+        compressed = _compress_context(text, tables, contexts)
+        with open(out_file, "wb") as f:
+            f.write(header)
+            f.write(compressed)
+    print("Bits per symbol:", 8 * len(compressed) / len(text))
+    metrics("bits_per_symbol", 8 * len(compressed) / len(text))
+
+
+def _compress_lz77_file(in_file: str, out_file: str, level: int,
+                        workers: int) -> int:
+    """ Write <in_file> to <out_file> as a FRAMED file of the literals and
+    matches that lz77_tokens finds at <level>, and return the size of
+    <in_file>.
+
+    <in_file> is read in blocks of LZ77_BLOCK_SIZE bytes, which are written
+    after the original size as _compress_lz77_block returns them, so memory
+    use does not grow with the size of <in_file>. Up to <workers> processes
+    do the blocks at once.
+    """
+    with open(in_file, "rb") as f1, open(out_file, "wb") as f2:
+        size = os.fstat(f1.fileno()).st_size
+        f2.write(MAGIC + bytes([VERSION, FLAG_LZ77])
+                 + size.to_bytes(8, "little"))
+        blocks = _with_history(_read_chunks(f1, chunk_size=LZ77_BLOCK_SIZE))
+        for block in pool_map(partial(_compress_lz77_block, level=level),
+                              blocks, workers):
+            f2.write(block)
+    return size
+
+
+def train_dictionary(samples: list[str], dict_file: str) -> int:
+    """ Build a tree from the bytes of all the files in <samples> together,
+    save its code lengths to the dictionary file <dict_file>, and return the
+    id of the dictionary.
+
+    Every byte gets a code, even if it is not in <samples>, so any file can
+    be compressed with the dictionary. The file holds DICTIONARY_MAGIC, the
+    id in 4 bytes and the 256 code lengths of canonical codes, and the id is
+    the CRC-32 of the code lengths.
+
+    A file compressed with a dictionary can only be decompressed with the
+    same one.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     for name, text in [("a", b"helloworld" * 10), ("b", b"xyz")]:
+    ...         with open(os.path.join(tmp, name), "wb") as f:
+    ...             _ = f.write(text)
+    ...     dictionary_id = train_dictionary([tmp + "/a"], tmp + "/dict")
+    ...     other_id = train_dictionary([tmp + "/b"], tmp + "/other")
+    ...     compress_file(tmp + "/b", tmp + "/out", dictionary=tmp + "/dict")
+    ...     with open(tmp + "/out", "rb") as f:
+    ...         f.read(6) == bytes([0, SHARED]) + int32_to_bytes(dictionary_id)
+    ...     decompress_file(tmp + "/out", tmp + "/orig",
+    ...                     dictionary=tmp + "/dict")
+    ...     with open(tmp + "/orig", "rb") as f:
+    ...         f.read()
+    ...     for dictionary in [None, tmp + "/other"]:
+    ...         try:
+    ...             decompress_file(tmp + "/out", tmp + "/orig",
+    ...                             dictionary=dictionary)
+    ...         except ValueError as error:
+    ...             str(error) == (f"dictionary {dictionary_id} is needed"
+    ...                            + (f", not {other_id}" if dictionary
+    ...                               else ""))
+    Bits per symbol: 9.0
+    True
+    b'xyz'
+    True
+    True
+    """
+    freq = {byte: 1 for byte in range(256)}
+    for sample in samples:
+        for byte, count in build_file_frequency_dict(sample).items():
+            freq[byte] += count
+    lengths = lengths_to_bytes(get_codes(build_huffman_tree(freq)))
+    dictionary_id = binascii.crc32(lengths)
+    with open(dict_file, "wb") as f:
+        f.write(DICTIONARY_MAGIC + int32_to_bytes(dictionary_id) + lengths)
+    return dictionary_id
+
+
+def load_dictionary(dict_file: str) -> tuple[int, bytes]:
+    """ Return the id and the code lengths in the dictionary file
+    <dict_file>, which was made by train_dictionary.
+
+    A ValueError is raised if <dict_file> is not a dictionary file, or if
+    its code lengths do not match its id.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/a", "wb") as f:
+    ...         _ = f.write(b"helloworld")
+    ...     dictionary_id = train_dictionary([tmp + "/a"], tmp + "/dict")
+    ...     load_dictionary(tmp + "/dict")[0] == dictionary_id
+    ...     for name in ["a", "dict"]:
+    ...         with open(tmp + "/" + name, "r+b") as f:
+    ...             _ = f.seek(-1, 2), f.write(b"\\xff")
+    ...         try:
+    ...             load_dictionary(tmp + "/" + name)
+    ...         except ValueError as error:
+    ...             os.path.basename(str(error))
+    True
+    'a is not a dictionary file'
+    'dict is damaged'
+    """
+    with open(dict_file, "rb") as f:
+        buf = f.read()
+    if buf[:4] != DICTIONARY_MAGIC or len(buf) != 264:
+        raise ValueError(f"{dict_file} is not a dictionary file")
+    dictionary_id, lengths = bytes_to_int(buf[4:8]), buf[8:]
+    if binascii.crc32(lengths) != dictionary_id:
+        raise ValueError(f"{dict_file} is damaged")
+    return dictionary_id, lengths
+
+
+@lru_cache(maxsize=DICTIONARY_CACHE_SIZE)
+def _dictionary_codes(dictionary_id: int, lengths: bytes) -> dict[int, str]:
+    """ Return the canonical codes with the code <lengths> of the dictionary
+    with id <dictionary_id>. The codes of the most recently used
+    dictionaries are kept, so they are only rebuilt when a dictionary is
+    used for the first time in a while.
+
+    >>> lengths = bytes([8] * 256)
+    >>> _dictionary_codes(1, lengths) is _dictionary_codes(1, lengths)
+    True
+    >>> _dictionary_codes(1, lengths)[65]
+    '01000001'
+    """
+    return canonical_codes(bytes_to_lengths(lengths))
+
+
+@lru_cache(maxsize=DICTIONARY_CACHE_SIZE)
+def _dictionary_decode_table(dictionary_id: int,
+                             lengths: bytes) -> list[tuple[bytes, int]]:
+    """ Return the decode table from _build_decode_table for the dictionary
+    with id <dictionary_id> and code <lengths>, kept like the codes from
+    _dictionary_codes.
+    """
+    return _build_decode_table(_dictionary_codes(dictionary_id, lengths))
+
+
+def _varint_to_bytes(num: int) -> bytes:
+    """ Return <num> in as few bytes as it takes, 7 bits per byte with the
+    lowest bits first and the top bit set in every byte but the last.
+
+    >>> list(_varint_to_bytes(5)), list(_varint_to_bytes(300))
+    ([5], [172, 2])
+    """
+    result = bytearray()
+    while num >= 0x80:
+        result.append(num & 0x7F | 0x80)
+        num >>= 7
+    result.append(num)
+    return bytes(result)
+
+
+def _read_varint(f: BinaryIO) -> int:
+    """ Return the number written by _varint_to_bytes at the current position
+    of the open file <f>, and move past it.
+
+    >>> _read_varint(io.BytesIO(bytes([172, 2, 9])))
+    300
+    """
+    num = 0
+    shift = 0
+    while True:
+        byte = f.read(1)[0]
+        num |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return num
+
+
+def _sync_points(chunks: Iterable[bytes], codes: dict[int, str],
+                 interval: int) -> list[int]:
+    """ Return the bit offsets, within the compressed form of the
+    concatenation of <chunks> using the mapping from <codes>, of the codes
+    of symbols 0, <interval>, 2 * <interval> and so on.
+
+    >>> d = {0: "0", 1: "10", 2: "11"}
+    >>> _sync_points([bytes([1, 2, 1]), bytes([0, 2])], d, 2)
+    [0, 4, 7]
+    """
+    # the code lengths fit in a byte, so translate() and sum() add them up
+    lengths = lengths_to_bytes(codes)
+    points = []
+    bits = 0
+    pos = 0
+    for chunk in chunks:
+        previous = 0
+        # the first sync point in this chunk
+        for i in range(-pos % interval, len(chunk), interval):
+            bits += sum(chunk[previous:i].translate(lengths))
+            points.append(bits)
+            previous = i
+        bits += sum(chunk[previous:].translate(lengths))
+        pos += len(chunk)
+    return points
+
+
+def _compress_mapped(text: mmap.mmap, out_file: str, header: bytes,
+                     codes: dict[int, str], freq: dict[int, int]) -> None:
+    """ Write <header> and then <text> compressed with <codes> to <out_file>
+    through a memory-mapped buffer, where <freq> is the frequency dictionary
+    of <text>.
+    """
+    # the same weighted sum as avg_length, but kept as a whole number of bits
+    bits = sum(count * len(codes[byte]) for byte, count in freq.items())
+    size = len(header) + (bits + 7) // 8
+    with open(out_file, "w+b") as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as out:
+            out[:len(header)] = header
+            pos = len(header)
+            for compressed in _compress_chunks(_mapped_chunks(text), codes):
+                out[pos:pos + len(compressed)] = compressed
+                pos += len(compressed)
+
+
+def _compress_blocks(in_file: str, out_file: str, workers: int) -> None:
+    """ Compress <in_file> into <out_file> as a BLOCKS file, using up to
+    <workers> processes.
+
+    After the two bytes that mark the format, each block is stored as
+    _compress_block returns it: usually just like a whole file in the
+    original format, with its tree, its size and its compressed bytes, but
+    raw or run-length encoded if that is smaller. An index of 8 bytes per
+    block, the compressed and the original size of the block, follows them,
+    and the last 4 bytes of the file are the number of blocks.
+    """
+    with open(in_file, "rb") as f1, open(out_file, "wb") as f2:
+        f2.write(bytes([0, BLOCKS]))
+        index = []
+        for compressed in pool_map(_compress_block,
+                                   _read_chunks(f1, chunk_size=BLOCK_SIZE),
+                                   workers):
+            f2.write(compressed)
+            index.append(int32_to_bytes(len(compressed))
+                         + int32_to_bytes(_block_size(compressed)))
+        f2.write(b"".join(index) + int32_to_bytes(len(index)))
+        size = f1.tell()
+    print("Bits per symbol:", 8 * os.path.getsize(out_file) / size)
+
+
+def _compress_block(block: bytes) -> bytes:
+    """ Return <block> in whichever of these is smallest: compressed with a
+    tree of its own, in the same format as a whole file compressed by
+    compress_file, or marked as BLOCK_RAW or BLOCK_RLE.
+
+    The size of the Huffman coded block is worked out with avg_length first,
+    so a block that is stored raw or run-length encoded is never encoded.
+
+    >>> block = _compress_block(b'helloworld' * 10)
+    >>> list(block[:5])
+    [6, 0, 104, 0, 101]
+    >>> _decompress_block(block) == b'helloworld' * 10
+    True
+    >>> _compress_block(b'abcd')
+    b'\\x00\\x01abcd'
+    >>> list(_compress_block(b'a' * 100))
+    [0, 2, 100, 0, 0, 0, 225, 97]
+    """
+    freq = build_frequency_dict(block)
     tree = build_huffman_tree(freq)
-    codes = get_codes(tree)
     number_nodes(tree)
-    print("Bits per symbol:", avg_length(tree, freq))
-    result = (tree.num_nodes_to_bytes() + tree_to_bytes(tree)
-              + int32_to_bytes(len(text)))
-    result += compress_bytes(text, codes)
-    with open(out_file, "wb") as f2:
-        f2.write(result)
+    candidates = [bytes([0, BLOCK_RAW]) + block]
+    if _RUN.search(block):
+        candidates.append(bytes([0, BLOCK_RLE]) + int32_to_bytes(len(block))
+                          + run_length_encode(block))
+    header = 5 + 4 * (tree.number + 1)
+    bits = avg_length(tree, freq) * len(block)
+    if header + bits / 8 < min(len(c) for c in candidates):
+        return (tree.num_nodes_to_bytes() + tree_to_bytes(tree)
+                + int32_to_bytes(len(block))
+                + compress_bytes(block, get_codes(tree)))
+    return min(candidates, key=len)
+
+
+def run_length_encode(text: bytes) -> bytes:
+    """ Return <text> run-length encoded, as a sequence of packets that each
+    start with a control byte c. If c is less than 128, the next c + 1 bytes
+    are copied as they are. Otherwise the next byte is repeated c - 125
+    times, which is 3 to 130.
+
+    >>> list(run_length_encode(b"abbbbc"))
+    [0, 97, 129, 98, 0, 99]
+    >>> list(run_length_encode(b"xy" + b"z" * 200))
+    [1, 120, 121, 255, 122, 195, 122]
+    >>> run_length_decode(run_length_encode(b"a" * 1000 + b"bc" * 100))[-4:]
+    b'bcbc'
+    """
+    result = bytearray()
+    pos = 0
+    for run in _RUN.finditer(text):
+        start, end = run.span()
+        _literal_packets(result, text[pos:start])
+        length = end - start
+        while length >= 3:
+            count = min(length, 130)
+            result += bytes([count + 125, text[start]])
+            length -= count
+        # the last one or two bytes of the run are copied as they are
+        pos = end - length
+    _literal_packets(result, text[pos:])
+    return bytes(result)
+
+
+def _literal_packets(result: bytearray, text: bytes) -> None:
+    """ Append the packets of run_length_encode that copy <text> as it is to
+    <result>.
+    """
+    for i in range(0, len(text), 128):
+        piece = text[i:i + 128]
+        result.append(len(piece) - 1)
+        result += piece
+
+
+def run_length_decode(buf: bytes) -> bytes:
+    """ Return the bytes that run_length_encode encoded into <buf>.
+
+    >>> run_length_decode(bytes([0, 97, 129, 98, 0, 99]))
+    b'abbbbc'
+    """
+    result = bytearray()
+    pos = 0
+    while pos < len(buf):
+        control = buf[pos]
+        if control < 128:
+            result += buf[pos + 1:pos + control + 2]
+            pos += control + 2
+        else:
+            result += buf[pos + 1:pos + 2] * (control - 125)
+            pos += 2
+    return bytes(result)
+
+
+def _block_size(compressed: bytes) -> int:
+    """ Return the original size of the block <compressed>, as returned by
+    _compress_block.
+
+    >>> _block_size(_compress_block(b'helloworld'))
+    10
+    >>> _block_size(_compress_block(b'abcd'))
+    4
+    """
+    if compressed[0] == 0:
+        if compressed[1] == BLOCK_RAW:
+            return len(compressed) - 2
+        return bytes_to_int(compressed[2:6])
+    num_nodes = compressed[0]
+    return bytes_to_int(compressed[1 + num_nodes * 4:5 + num_nodes * 4])
 
 
 def generate_tree_general(node_lst: list[ReadNode],
@@ -377,6 +1953,133 @@ HuffmanTree(None, HuffmanTree(10, None, None), HuffmanTree(12, None, None)))
     return nodes[root_index]
 
 
+def _build_decode_table(codes: dict[int, str], width: int = 8,
+                        expansions: Optional[list[bytes]] = None) \
+        -> list[tuple[bytes, int]]:
+    """ Return a lookup table that decodes <codes> one byte at a time, or
+    <width> bits at a time if <width> is 1, 2 or 4 instead of 8. Symbol
+    <s> decodes to the bytes <expansions>[s], or to the byte <s> if
+    <expansions> is None.
+
+    The proper prefixes of the codes, which are the internal nodes of their
+    Huffman tree, are the states of the decoder. They are numbered shortest
+    first, so the empty prefix (the root) is state 0. A state is where the
+    walk down the tree was left off by the previous byte, so codes longer
+    than 8 bits need no special case. The entry at index (state << 8) | byte
+    is a (decoded, next_state) pair: the symbols completed while following
+    the 8 bits of <byte> from <state>, and the state the walk ends in.
+
+    Only the codes are needed, so the same table serves codes read from a
+    HuffmanTree and canonical codes rebuilt from their lengths.
+
+    Precondition: <codes> has at least two symbols and every bit string is
+    either a code or the prefix of one.
+
+    >>> table = _build_decode_table({3: "0", 2: "1"})
+    >>> len(table)
+    256
+    >>> table[0b01100000]
+    (b'\\x03\\x02\\x02\\x03\\x03\\x03\\x03\\x03', 0)
+    >>> table = _build_decode_table({1: "0", 2: "10", 3: "11"})
+    >>> table[0b00000001]
+    (b'\\x01\\x01\\x01\\x01\\x01\\x01\\x01', 1)
+    >>> table[(1 << 8) | 0b11000000]
+    (b'\\x03\\x02\\x01\\x01\\x01\\x01\\x01', 0)
+    >>> _build_decode_table({1: "0", 2: "10", 3: "11"}, 1)
+    [(b'\\x01', 0), (b'', 1), (b'\\x02', 0), (b'\\x03', 0)]
+    >>> _build_decode_table({0: "0", 1: "1"}, 1, [b"ab", b"c"])
+    [(b'ab', 0), (b'c', 0)]
+    """
+    if expansions is None:
+        expansions = [bytes([byte]) for byte in range(256)]
+    symbols = {code: expansions[symbol] for symbol, code in codes.items()}
+    prefixes = sorted({code[:i] for code in codes.values()
+                       for i in range(len(code))},
+                      key=lambda x: (len(x), x))
+    index = {prefix: i for i, prefix in enumerate(prefixes)}
+    # the walk for one bit from every state
+    table = []
+    for prefix in prefixes:
+        for bit in "01":
+            if prefix + bit in symbols:
+                table.append((symbols[prefix + bit], 0))
+            else:
+                table.append((b"", index[prefix + bit]))
+    return _widen_decode_table(table, len(prefixes), width)
+
+
+def _widen_decode_table(table: list[tuple[bytes, int]], states: int,
+                        width: int) -> list[tuple[bytes, int]]:
+    """ Return the lookup table for <width> bits at a time with the same
+    <states> states as <table>, which is for 1 bit at a time.
+    """
+    # walking 1, 2 and 4 bits from every state is cheap, and two of those
+    # walks glued together give the walk for twice as many bits
+    bits = 1
+    while bits < width:
+        wider = []
+        for state in range(states):
+            for high in range(1 << bits):
+                first, middle = table[(state << bits) | high]
+                for low in range(1 << bits):
+                    second, end = table[(middle << bits) | low]
+                    wider.append((first + second, end))
+        table = wider
+        bits *= 2
+    return table
+
+
+def _build_context_decode_table(
+        tables: list[dict[int, str]], contexts: list[int],
+        width: int = 8) -> tuple[list[tuple[bytes, int]], list[int], int]:
+    """ Return a lookup table like the one from _build_decode_table that
+    decodes an order-1 context model, the state at the root of each of
+    <tables>, and the number of bits it decodes at a time. The codes after
+    byte <b> are <tables>[<contexts>[b]].
+
+    A state is now a table and a prefix of one of its codes, and finishing
+    a code moves to the root of the table the decoded byte picks.
+
+    There can be thousands of states, one per internal node of every table,
+    so the table decodes the most of 8, 4, 2 and 1 bits, and at most
+    <width> bits, that keeps it to CONTEXT_TABLE_SIZE entries.
+
+    >>> table, roots, width = _build_context_decode_table(
+    ...     [{0: "0", 1: "1"}, {0: "1", 1: "0"}], [0, 1] + [0] * 254, 1)
+    >>> roots, width
+    ([0, 1], 1)
+    >>> table
+    [(b'\\x00', 0), (b'\\x01', 1), (b'\\x01', 1), (b'\\x00', 0)]
+    >>> tables = [canonical_codes(dict.fromkeys(range(256), 8))] * 256
+    >>> _build_context_decode_table(tables, list(range(256)))[2]
+    2
+    """
+    roots = []
+    table = []
+    for codes in tables:
+        prefixes = sorted({code[:i] for code in codes.values()
+                           for i in range(len(code))},
+                          key=lambda x: (len(x), x))
+        roots.append(len(table) // 2)
+        index = {prefix: roots[-1] + i for i, prefix in enumerate(prefixes)}
+        symbols = {code: symbol for symbol, code in codes.items()}
+        for prefix in prefixes:
+            for bit in "01":
+                if prefix + bit in symbols:
+                    symbol = symbols[prefix + bit]
+                    # the root of the next table is filled in below, once
+                    # every table has been numbered
+                    table.append((bytes([symbol]), -1 - symbol))
+                else:
+                    table.append((b"", index[prefix + bit]))
+    table = [(decoded, roots[contexts[-1 - state]] if state < 0 else state)
+             for decoded, state in table]
+    states = len(table) // 2
+    while width > 1 and states << width > CONTEXT_TABLE_SIZE:
+        width //= 2
+    return _widen_decode_table(table, states, width), roots, width
+
+
 def decompress_bytes(tree: HuffmanTree, text: bytes, size: int) -> bytes:
     """ Use Huffman tree <tree> to decompress <size> bytes from <text>.
 
@@ -385,38 +2088,740 @@ def decompress_bytes(tree: HuffmanTree, text: bytes, size: int) -> bytes:
     >>> decompress_bytes(tree, \
              compress_bytes(b'helloworld', get_codes(tree)), len(b'helloworld'))
     b'helloworld'
+    >>> decompress_bytes(HuffmanTree(7), b'', 3)
+    b'\\x07\\x07\\x07'
     """
-    bits = []
-    for i in text:
-        bits.extend(byte_to_bits(i))
-    result = bytearray()
-    i = 0
-    while i < len(bits) and len(result) < size:
-        node = tree
-        while not node.is_leaf():
-            node = node.left if bits[i] == "0" else node.right
-            i += 1
-        result.append(node.symbol)
-    return bytes(result)
+    return b"".join(_decompress_chunks(get_codes(tree), [text], size))
+
+
+def _decompress_chunks(codes: dict[int, str], chunks: Iterable[bytes],
+                       size: int, skip: int = 0,
+                       expansions: Optional[list[bytes]] = None,
+                       table: Optional[list[tuple[bytes, int]]] = None) \
+        -> Iterator[bytes]:
+    """ Use the mapping from <codes> to decompress <size> bytes from the
+    concatenation of <chunks>, yielding the decompressed bytes of each chunk
+    as soon as it has been decoded. A code may be split across two chunks.
+    The first <skip> bits of the first chunk are not decoded. Symbols decode
+    to bytes as in _build_decode_table. <table> is the table from
+    _build_decode_table for <codes> and <expansions>, if it was built
+    already.
+
+    >>> codes = get_codes(build_huffman_tree(build_frequency_dict(b'hello')))
+    >>> compressed = compress_bytes(b'hello', codes)
+    >>> list(_decompress_chunks(codes, [compressed[:1], compressed[1:]], 5))
+    [b'hell', b'o']
+    >>> list(_decompress_chunks(codes, [compressed], 2, 4))
+    [b'll']
+    """
+    if len(codes) == 1:
+        # a tree that is a single leaf gives it the empty code,
+        # so there is nothing to read
+        symbol = list(codes)[0]
+        piece = bytes([symbol]) if expansions is None else expansions[symbol]
+        while size > 0:
+            yield (piece * -(-CHUNK_SIZE // len(piece)))[:min(size,
+                                                              CHUNK_SIZE)]
+            size -= CHUNK_SIZE
+        return
+    # one table lookup per input byte instead of one tree step per bit
+    if table is None:
+        table = _build_decode_table(codes, 8, expansions)
+    state = 0
+    for chunk in chunks:
+        result = bytearray()
+        if skip:
+            # start part way into the first byte, one bit at a time
+            steps = _build_decode_table(codes, 1, expansions)
+            for bit_num in range(7 - skip, -1, -1):
+                decoded, state = steps[(state << 1)
+                                       | get_bit(chunk[0], bit_num)]
+                result += decoded
+            chunk = chunk[1:]
+            skip = 0
+        for byte in chunk:
+            decoded, state = table[(state << 8) | byte]
+            result += decoded
+        if len(result) >= size:
+            # the padding in the last byte may decode into extra symbols
+            yield bytes(result[:size])
+            return
+        size -= len(result)
+        yield bytes(result)
+
+
+def _decompress_lz77_chunks(chunks: Iterable[bytes],
+                            size: int) -> Iterator[bytes]:
+    """ Decompress <size> bytes from the concatenation of <chunks>, which
+    hold the blocks of a FLAG_LZ77 file, yielding each block as soon as it
+    has been decoded. Only one block and the LZ77_WINDOW bytes before it,
+    which its matches can reach back into, are kept at a time.
+
+    >>> text = b"abracadabra abracadabra abracadabra"
+    >>> compressed = b"".join(_compress_lz77_block(job, 6) for job in
+    ...                       _with_history([text[:20], text[20:]]))
+    >>> b"".join(_decompress_lz77_chunks([compressed[:3], compressed[3:]],
+    ...                                  len(text))) == text
+    True
+    """
+    buffer = bytearray()
+    history = b""
+    chunks = iter(chunks)
+    while size > 0:
+        while len(buffer) < 4 or len(buffer) < 4 + bytes_to_int(buffer[:4]):
+            buffer += next(chunks)
+        end = 4 + bytes_to_int(buffer[:4])
+        block = _decompress_lz77_block(bytes(buffer[4:end]), history)
+        del buffer[:end]
+        history = (history + block)[-LZ77_WINDOW:]
+        yield block[:size]
+        size -= len(block)
+
 
+def _decompress_lz77_block(buf: bytes, history: bytes) -> bytes:
+    """ Return the block whose compressed form, after its length, is <buf>,
+    as written by _compress_lz77_block, where <history> is the LZ77_WINDOW
+    bytes before it.
 
-def decompress_file(in_file: str, out_file: str) -> None:
+    >>> job = (b"abracadabra ", b"abracadabra")
+    >>> _decompress_lz77_block(_compress_lz77_block(job, 6)[4:], job[0])
+    b'abracadabra'
+    """
+    size = bytes_to_int(buf[:4])
+    lengths = buf[4:4 + 256 + LZ77_LENGTH_CODES + LZ77_DISTANCE_CODES]
+    literal_table = _build_peek_table(canonical_codes(bytes_to_lengths(
+        lengths[:256 + LZ77_LENGTH_CODES])))
+    distance_table = _build_peek_table(canonical_codes(bytes_to_lengths(
+        lengths[256 + LZ77_LENGTH_CODES:])))
+    width = PEEK_CODE_LENGTH
+    # the smallest value and the number of extra bits of each code
+    bases = [0, 1, 2, 3] + [(2 + (code & 1)) << ((code - 2) // 2)
+                            for code in range(4, LZ77_DISTANCE_CODES)]
+    extras = [0, 0, 0, 0] + [(code - 2) // 2
+                             for code in range(4, LZ77_DISTANCE_CODES)]
+    # the buffer is topped up until it holds the most bits a match takes,
+    # so the zeros let the last refills read past the end
+    data = buf[4 + len(lengths):] + bytes(16)
+    result = bytearray(history)
+    end = len(history) + size
+    position = 0
+    buffer = 0
+    count = 0
+    while len(result) < end:
+        # the most bits a match takes: two codes and their extra bits
+        if count < 2 * width + 19:
+            buffer = (((buffer & ((1 << count) - 1)) << 32)
+                      | int.from_bytes(data[position:position + 4], "big"))
+            position += 4
+            count += 32
+            continue
+        symbol, length = literal_table[(buffer >> (count - width))
+                                       & ((1 << width) - 1)]
+        count -= length
+        if symbol < 256:
+            result.append(symbol)
+            continue
+        code = symbol - 256
+        count -= extras[code]
+        length = (LZ77_MIN_MATCH + bases[code]
+                  + ((buffer >> count) & ((1 << extras[code]) - 1)))
+        code, bits = distance_table[(buffer >> (count - width))
+                                    & ((1 << width) - 1)]
+        count -= bits + extras[code]
+        distance = (1 + bases[code]
+                    + ((buffer >> count) & ((1 << extras[code]) - 1)))
+        start = len(result) - distance
+        if length <= distance:
+            result += result[start:start + length]
+        else:
+            # the match overlaps the bytes it makes, so it repeats the last
+            # <distance> bytes
+            result += (result[start:] * (length // distance + 1))[:length]
+    return bytes(result[len(history):end])
+
+
+def _build_peek_table(codes: dict[int, str]) -> list[tuple[int, int]]:
+    """ Return the (symbol, length) pair of the code that every possible
+    PEEK_CODE_LENGTH bits start with, indexed by those bits, for the
+    <codes> of one alphabet of a FLAG_LZ77 or FLAG_BWT file.
+
+    >>> table = _build_peek_table({5: "0", 7: "1"})
+    >>> table[0], table[(1 << PEEK_CODE_LENGTH) - 1]
+    ((5, 1), (7, 1))
+    """
+    table = [(0, 0)] * (1 << PEEK_CODE_LENGTH)
+    for symbol, code in codes.items():
+        free = PEEK_CODE_LENGTH - len(code)
+        first = int(code, 2) << free if code else 0
+        table[first:first + (1 << free)] = [(symbol, len(code))] * (1 << free)
+    return table
+
+
+def _decompress_bwt_chunks(chunks: Iterable[bytes],
+                           size: int) -> Iterator[bytes]:
+    """ Decompress <size> bytes from the concatenation of <chunks>, which
+    hold the blocks of a FLAG_BWT file, yielding each block as soon as it
+    has been decoded. Only one block is kept at a time, and the last one is
+    cut short if <size> ends inside it.
+
+    >>> text = b"abracadabra" * 3
+    >>> compressed = _compress_bwt_block(text[:20]) + _compress_bwt_block(
+    ...     text[20:])
+    >>> b"".join(_decompress_bwt_chunks([compressed], 33)) == text
+    True
+    >>> b"".join(_decompress_bwt_chunks([compressed], 25))
+    b'abracadabraabracadabraabr'
+    """
+    buffer = bytearray()
+    chunks = iter(chunks)
+    while size > 0:
+        while len(buffer) < 4 or len(buffer) < 4 + bytes_to_int(buffer[:4]):
+            buffer += next(chunks)
+        end = 4 + bytes_to_int(buffer[:4])
+        block = _decompress_bwt_block(bytes(buffer[4:end]))
+        del buffer[:end]
+        yield block[:size]
+        size -= len(block)
+
+
+def _decompress_bwt_block(buf: bytes) -> bytes:
+    """ Return the block whose compressed form, after its length, is <buf>,
+    as written by _compress_bwt_block.
+
+    >>> _decompress_bwt_block(_compress_bwt_block(b"banana")[4:])
+    b'banana'
+    """
+    size = bytes_to_int(buf[:4])
+    index = bytes_to_int(buf[4:8])
+    buf = buf[8:]
+    codes = canonical_codes(bytes_to_lengths(buf[:BWT_SYMBOLS]))
+    table = _build_peek_table(codes)
+    width = PEEK_CODE_LENGTH
+    # the zeros let the last refill read past the end
+    data = buf[BWT_SYMBOLS:] + bytes(4)
+    mtf = bytearray(range(256))
+    last = bytearray()
+    position = 0
+    buffer = 0
+    count = 0
+    run = 0
+    weight = 1
+    while len(last) + run < size:
+        if count < width:
+            buffer = (((buffer & ((1 << count) - 1)) << 32)
+                      | int.from_bytes(data[position:position + 4], "big"))
+            position += 4
+            count += 32
+        symbol, length = table[(buffer >> (count - width))
+                               & ((1 << width) - 1)]
+        count -= length
+        if symbol <= RUNB:
+            run += weight << symbol
+            weight <<= 1
+            continue
+        if run:
+            last += bytes([mtf[0]]) * run
+            run, weight = 0, 1
+        byte = mtf[symbol - 1]
+        del mtf[symbol - 1]
+        mtf.insert(0, byte)
+        last.append(byte)
+    last += bytes([mtf[0]]) * run
+    return inverse_bwt(bytes(last), index)
+
+
+def _unfilter_chunks(decode: Callable[..., Iterator[bytes]], block_size: int,
+                     row: int, choices: bytes, chunks: Iterable[bytes],
+                     size: int) -> Iterator[bytes]:
+    """ Yield the <size> bytes that <decode> decompresses from <chunks>,
+    with the filter of each block of <block_size> bytes undone. <choices>
+    are the filters from choose_filters, and <row> is the number of bytes
+    per row they used.
+
+    >>> text = bytes(range(50)) * 2
+    >>> filtered, choices = choose_filters(text, 0, 0, _huffman_cost)
+    >>> b"".join(_unfilter_chunks(lambda chunks, size: iter(chunks),
+    ...     FILTER_BLOCK_SIZE, 0, choices, [filtered], 100)) == text
+    True
+    """
+    context = row + FILTER_MAX_STRIDE
+    buf = bytearray(context)
+    for block, part in enumerate(_rechunk(decode(chunks, size), block_size)):
+        buf = buf[-context:] + part
+        undo_filter(buf, context, choices[block], row)
+        yield bytes(buf[context:])
+
+
+def _rechunk(parts: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """ Yield the concatenation of <parts> in pieces of <size> bytes, and
+    then whatever is left.
+
+    >>> list(_rechunk([b"abc", b"", b"defg"], 3))
+    [b'abc', b'def', b'g']
+    """
+    pending = bytearray()
+    for part in parts:
+        pending += part
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
+
+
+def _decompress_context_chunks(tables: list[dict[int, str]],
+                               contexts: list[int], chunks: Iterable[bytes],
+                               size: int) -> Iterator[bytes]:
+    """ Decompress <size> bytes from the concatenation of <chunks>, coded
+    with the order-1 model with <tables> and <contexts>, yielding the
+    decompressed bytes of each chunk as soon as it has been decoded.
+
+    >>> tables, contexts = build_context_model(b"abracadabra")
+    >>> compressed = _compress_context(b"abracadabra", tables, contexts)
+    >>> b"".join(_decompress_context_chunks(tables, contexts,
+    ...                                     [compressed], 11))
+    b'abracadabra'
+    """
+    table, roots, width = _build_context_decode_table(tables, contexts)
+    state = roots[contexts[0]]
+    mask = (1 << width) - 1
+    for chunk in chunks:
+        result = bytearray()
+        if width == 8:
+            for byte in chunk:
+                decoded, state = table[(state << 8) | byte]
+                result += decoded
+        else:
+            # the table is too narrow for a whole byte, so each byte takes
+            # 8 // width lookups
+            for byte in chunk:
+                for shift in range(8 - width, -1, -width):
+                    decoded, state = table[(state << width)
+                                           | ((byte >> shift) & mask)]
+                    result += decoded
+        if len(result) >= size:
+            # the padding in the last byte may decode into extra symbols
+            yield bytes(result[:size])
+            return
+        size -= len(result)
+        yield bytes(result)
+
+
+def decompress_file(in_file: str, out_file: str, stream: bool = False,
+                    workers: int = 1, mapped: bool = False,
+                    dictionary: Optional[str] = None,
+                    metrics: Callable[[str, float], None] = _no_metrics) \
+        -> None:
     """ Decompress contents of <in_file> and store results in <out_file>.
     Both <in_file> and <out_file> are string objects representing the names of
     the input and output files.
 
+    If <stream> is True, <in_file> is read CHUNK_SIZE bytes at a time and
+    each decompressed chunk is written out before the next one is read.
+
+    If <mapped> is True, <in_file> is decoded straight from a memory-mapped
+    buffer into <out_file>, memory-mapped at its original size.
+
+    The blocks of a BLOCKS file are always read one at a time, and are
+    decompressed by up to <workers> processes at once.
+
+    A SHARED file needs the name of the dictionary file it was compressed
+    with as <dictionary>.
+
+    <metrics> is called with the name and value of each measurement taken
+    along the way: the time in seconds it takes to read the header and
+    rebuild the tree, as "rebuild_tree_seconds", and to decode the rest, as
+    "decode_seconds", and "input_bytes" and "output_bytes". Only the
+    decoding of blocks, adaptive codes and SHARED files is timed.
+
+    Files in the formats from before FRAMED are still read: the original
+    format, CANONICAL and INDEXED. A FRAMED file with a size of 0 has no
+    codes, and decompresses to an empty file.
+
     Precondition: The contents of the file <in_file> are not empty.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     open(tmp + "/in", "wb").close()
+    ...     compress_file(tmp + "/in", tmp + "/out", canonical=True)
+    ...     decompress_file(tmp + "/out", tmp + "/orig", mapped=True)
+    ...     os.path.getsize(tmp + "/out"), os.path.getsize(tmp + "/orig")
+    (14, 0)
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(b"helloworld" * 10)
+    ...     for options in [{}, {"canonical": True}, {"sync_interval": 7}]:
+    ...         compress_file(tmp + "/in", tmp + "/out", legacy=True,
+    ...                       **options)
+    ...         with open(tmp + "/out", "rb") as f:
+    ...             list(f.read(2))
+    ...         decompress_file(tmp + "/out", tmp + "/orig")
+    ...         with open(tmp + "/orig", "rb") as f:
+    ...             f.read() == b"helloworld" * 10
+    Bits per symbol: 2.7
+    [6, 0]
+    True
+    Bits per symbol: 2.7
+    [0, 1]
+    True
+    Bits per symbol: 2.7
+    [0, 3]
+    True
     """
     with open(in_file, "rb") as f:
+        file_format = _read_format(f)
+        if file_format in (ADAPTIVE, BLOCKS, SHARED):
+            with _timed(metrics, "decode"), open(out_file, "wb") as g:
+                if file_format == ADAPTIVE:
+                    adaptive_decompress(f, g)
+                elif file_format == SHARED:
+                    g.write(_decompress_shared(f, dictionary))
+                else:
+                    for block in pool_map(_decompress_block,
+                                          _read_blocks(f), workers):
+                        g.write(block)
+        else:
+            with _timed(metrics, "rebuild_tree"):
+                codes, size, flags = _read_header(f, file_format)
+                if flags & FLAG_INDEXED:
+                    # the sync points are only needed by decompress_range
+                    _read_sync_point(f, size, file_format)
+                decode = _decoder(f, codes, flags)
+            with _timed(metrics, "decode"):
+                if size == 0:
+                    # mmap cannot map an empty file
+                    open(out_file, "wb").close()
+                elif mapped:
+                    _decompress_mapped(f, out_file, decode, size)
+                else:
+                    with open(out_file, "wb") as g:
+                        if stream:
+                            for decompressed in decode(_read_chunks(f), size):
+                                g.write(decompressed)
+                        else:
+                            text = f.read()
+                            g.write(b"".join(decode([text], size)))
+    metrics("input_bytes", os.path.getsize(in_file))
+    metrics("output_bytes", os.path.getsize(out_file))
+
+
+def _read_format(f: BinaryIO) -> int:
+    """ Return the format of the compressed file <f>, which is ORIGINAL or
+    one of the formats marked by a 0 byte, and move past the marker.
+
+    Precondition: <f> is positioned at its start.
+    """
+    if f.read(1)[0] != 0:
+        # the number of nodes in the tree of an ORIGINAL file
+        f.seek(0)
+        return ORIGINAL
+    file_format = f.read(1)[0]
+    if file_format == FRAMED and f.read(2) != MAGIC[2:]:
+        raise ValueError("not a compressed file")
+    if file_format not in (CANONICAL, BLOCKS, INDEXED, ADAPTIVE, SHARED,
+                           FRAMED):
+        raise ValueError(f"unknown file format {file_format}")
+    return file_format
+
+
+def _read_header(f: BinaryIO,
+                 file_format: int) -> tuple[dict[int, str], int, int]:
+    """ Return the codes, the original size and the feature flags stored in
+    the header of the compressed file <f>, which is in <file_format>. Files
+    in the older formats get the flags of the features they have. The codes
+    of a FLAG_CONTEXT, FLAG_LZ77 or FLAG_BWT file are left for _decoder, and
+    an empty dict is returned for them.
+
+    Precondition: <f> is positioned just after the marker of its format, and
+    <file_format> is not BLOCKS or ADAPTIVE.
+    """
+    if file_format == FRAMED:
+        version, flags = f.read(2)
+        if not 1 <= version <= VERSION:
+            raise ValueError(f"unsupported version {version}")
+        if flags & ~(FLAG_CANONICAL | FLAG_INDEXED | FLAG_DIGRAMS
+                     | FLAG_CONTEXT | FLAG_LZ77 | FLAG_BWT | FLAG_FILTERS):
+            raise ValueError(f"unknown feature flags {flags}")
+        size = bytes_to_int(f.read(8))
+        if flags & (FLAG_CONTEXT | FLAG_LZ77 | FLAG_BWT) or size == 0:
+            # the codes are read by _decoder, and an empty file has none
+            return {}, size, flags
+        return _read_codes(f, bool(flags & FLAG_CANONICAL),
+                           bool(flags & FLAG_DIGRAMS)), size, flags
+    flags = {CANONICAL: FLAG_CANONICAL,
+             INDEXED: FLAG_INDEXED}.get(file_format, 0)
+    codes = _read_codes(f, file_format == CANONICAL)
+    return codes, bytes_to_int(f.read(4)), flags
+
+
+def _read_codes(f: BinaryIO, canonical: bool,
+                wide: bool = False) -> dict[int, str]:
+    """ Return the codes stored in the open file <f>, as canonical code
+    lengths if <canonical> is True, or as a tree otherwise. The tree has
+    2 bytes per node number or symbol if <wide> is True.
+    """
+    if canonical:
+        return canonical_codes(bytes_to_lengths(f.read(256)))
+    if wide:
+        num_nodes = bytes_to_int(f.read(2))
+        node_lst = bytes_to_wide_nodes(f.read(num_nodes * 6))
+    else:
         num_nodes = f.read(1)[0]
         buf = f.read(num_nodes * 4)
         node_lst = bytes_to_nodes(buf)
-        # use generate_tree_general or generate_tree_postorder here
-        tree = generate_tree_general(node_lst, num_nodes - 1)
-        size = bytes_to_int(f.read(4))
-        with open(out_file, "wb") as g:
-            text = f.read()
-            g.write(decompress_bytes(tree, text, size))
+    # use generate_tree_general or generate_tree_postorder here
+    tree = generate_tree_general(node_lst, num_nodes - 1)
+    return get_codes(tree)
+
+
+def bytes_to_wide_nodes(buf: bytes) -> list[ReadNode]:
+    """ Return a list of ReadNodes corresponding to the bytes in <buf>, as
+    written by tree_to_bytes with a width of 2.
+
+    >>> bytes_to_wide_nodes(bytes([0, 44, 1, 1, 2, 0]))
+    [ReadNode(0, 300, 1, 2)]
+    """
+    return [ReadNode(buf[i], bytes_to_int(buf[i + 1:i + 3]),
+                     buf[i + 3], bytes_to_int(buf[i + 4:i + 6]))
+            for i in range(0, len(buf), 6)]
+
+
+def _read_context_model(f: BinaryIO) \
+        -> tuple[list[dict[int, str]], list[int]]:
+    """ Return the tables and the contexts of the order-1 model stored by
+    context_model_to_bytes in the FLAG_CONTEXT file <f>.
+
+    Precondition: <f> is positioned just after the original size.
+
+    >>> tables, contexts = build_context_model(b"abracadabra")
+    >>> buf = io.BytesIO(context_model_to_bytes(tables, contexts))
+    >>> _read_context_model(buf) == (tables, contexts)
+    True
+    """
+    bitmap = f.read(32)
+    contexts = [0] * 256
+    tables = [{}]
+    for previous in range(256):
+        if bitmap[previous // 8] >> (previous % 8) & 1:
+            contexts[previous] = len(tables)
+            tables.append({})
+    for i in range(len(tables)):
+        count = bytes_to_int(f.read(2))
+        buf = f.read(2 * count)
+        tables[i] = canonical_codes(dict(zip(buf[:count], buf[count:])))
+    return tables, contexts
+
+
+def _decoder(f: BinaryIO, codes: dict[int, str], flags: int) \
+        -> Callable[..., Iterator[bytes]]:
+    """ Return a function that decompresses the open file <f> with <codes>
+    and the feature <flags> read from its header. It is called with the
+    chunks and the number of bytes to decompress, as _decompress_chunks is
+    after its <codes>, and reads the rest of the header from <f> first.
+
+    Precondition: <f> is positioned after everything in its header but the
+    pairs of a FLAG_DIGRAMS file, the model of a FLAG_CONTEXT file or the
+    filters of a FLAG_FILTERS file.
+    """
+    if flags & FLAG_BWT:
+        return _decompress_bwt_chunks
+    if flags & FLAG_CONTEXT:
+        return partial(_decompress_context_chunks, *_read_context_model(f))
+    if flags & FLAG_LZ77:
+        return _decompress_lz77_chunks
+    if flags & FLAG_FILTERS:
+        block_size, row, count = [bytes_to_int(f.read(4)) for _ in range(3)]
+        return partial(_unfilter_chunks, partial(_decompress_chunks, codes),
+                       block_size, row, f.read(count))
+    expansions = _read_digrams(f) if flags & FLAG_DIGRAMS else None
+    return partial(_decompress_chunks, codes, expansions=expansions)
+
+
+def _read_digrams(f: BinaryIO) -> list[bytes]:
+    """ Return the bytes that each symbol of the FLAG_DIGRAMS file <f> stands
+    for, indexed by symbol.
+
+    Precondition: <f> is positioned just after the codes.
+    """
+    count = bytes_to_int(f.read(2))
+    buf = f.read(2 * count)
+    return ([bytes([byte]) for byte in range(256)]
+            + [buf[i:i + 2] for i in range(0, len(buf), 2)])
+
+
+def _read_sync_point(f: BinaryIO, size: int, file_format: int,
+                     start: int = 0) -> tuple[int, int]:
+    """ Return the interval of the sync points stored in the header of the
+    compressed file <f>, which is in <file_format> and whose original size is
+    <size>, and the last sync point at or before byte <start> of the
+    original file. <f> is left just after the sync points.
+
+    Every sync point takes 8 bytes, so only the one asked for is read.
+
+    Precondition: <f> is positioned just after the codes of a FRAMED file
+    or the original size of an INDEXED file, and 0 <= <start> < <size>.
+    """
+    interval = bytes_to_int(f.read(8 if file_format == FRAMED else 4))
+    index = f.tell()
+    f.seek(index + 8 * (start // interval))
+    point = bytes_to_int(f.read(8))
+    f.seek(index + 8 * -(-size // interval))
+    return interval, point
+
+
+def decompress_range(in_file: str, start: int, length: int,
+                     dictionary: Optional[str] = None) -> bytes:
+    """ Return <length> bytes of the original file, starting at byte <start>,
+    from the compressed file <in_file>. Fewer bytes are returned if the
+    original file ends first. <dictionary> is needed for a SHARED file, as
+    in decompress_file.
+
+    Only the part of <in_file> the range is in gets decoded: from the last
+    sync point at or before <start> in a file with sync points, or the blocks
+    that hold the range in a BLOCKS file. Files in the other formats are
+    decoded from their first byte up to the end of the range.
+
+    >>> import tempfile
+    >>> text = bytes(range(97, 123)) * 40
+    >>> ranges = [(0, 5), (61, 10), (1038, 10), (2000, 5)]
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with open(tmp + "/in", "wb") as f:
+    ...         _ = f.write(text)
+    ...     for options in [{}, {"legacy": True}, {"canonical": True}]:
+    ...         compress_file(tmp + "/in", tmp + "/out", sync_interval=64,
+    ...                       **options)
+    ...         [decompress_range(tmp + "/out", start, length)
+    ...          for start, length in ranges]
+    Bits per symbol: 4.769230769230769
+    [b'abcde', b'jklmnopqrs', b'yz', b'']
+    Bits per symbol: 4.769230769230769
+    [b'abcde', b'jklmnopqrs', b'yz', b'']
+    Bits per symbol: 4.769230769230769
+    [b'abcde', b'jklmnopqrs', b'yz', b'']
+    """
+    end = start + length
+    with open(in_file, "rb") as f:
+        file_format = _read_format(f)
+        if file_format == ADAPTIVE:
+            decompressed = io.BytesIO()
+            adaptive_decompress(f, decompressed, start + length)
+            return decompressed.getvalue()[start:]
+        if file_format == SHARED:
+            return _decompress_shared(f, dictionary, end)[start:]
+        if file_format == BLOCKS:
+            offset = f.tell()
+            begin = 0
+            first = None
+            result = []
+            for compressed_size, size in _read_block_index(f):
+                if begin < end and start < begin + size:
+                    first = begin if first is None else first
+                    f.seek(offset)
+                    result.append(_decompress_block(f.read(compressed_size)))
+                begin += size
+                offset += compressed_size
+            return b"".join(result)[start - (first or 0):][:length]
+        codes, size, flags = _read_header(f, file_format)
+        end = min(end, size)
+        if start >= end:
+            return b""
+        first, skip, point = 0, 0, 0
+        if flags & FLAG_INDEXED:
+            interval, point = _read_sync_point(f, size, file_format, start)
+            first = start // interval * interval
+            skip = point % 8
+        # the rest of the header comes after the sync points
+        decode = _decoder(f, codes, flags)
+        f.seek(point // 8, os.SEEK_CUR)
+        # a small range should not need a whole CHUNK_SIZE read
+        chunks = _read_chunks(f, chunk_size=min(CHUNK_SIZE,
+                                                max(end - first, 4096)))
+        if skip:
+            decode = partial(decode, skip=skip)
+        return b"".join(decode(chunks, end - first))[start - first:]
+
+
+def _decompress_shared(f: BinaryIO, dictionary: Optional[str],
+                       limit: int = -1) -> bytes:
+    """ Return the decompressed form of the rest of the SHARED file <f>,
+    which was compressed with the dictionary file <dictionary>, or only its
+    first <limit> bytes if <limit> is not -1.
+
+    Precondition: <f> is positioned just after the marker of its format.
+    """
+    dictionary_id = bytes_to_int(f.read(4))
+    size = _read_varint(f)
+    if dictionary is None:
+        raise ValueError(f"dictionary {dictionary_id} is needed")
+    loaded_id, lengths = load_dictionary(dictionary)
+    if loaded_id != dictionary_id:
+        raise ValueError(f"dictionary {dictionary_id} is needed, "
+                         f"not {loaded_id}")
+    if limit != -1:
+        size = min(size, limit)
+    return b"".join(_decompress_chunks(
+        _dictionary_codes(dictionary_id, lengths), [f.read()], size,
+        table=_dictionary_decode_table(dictionary_id, lengths)))
+
+
+def _decompress_mapped(f: BinaryIO, out_file: str,
+                       decode: Callable[..., Iterator[bytes]],
+                       size: int) -> None:
+    """ Use <decode>, as returned by _decoder, to decompress <size> bytes
+    from the rest of the open file <f> into <out_file>, through
+    memory-mapped buffers.
+    """
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text, \
+            open(out_file, "w+b") as g:
+        g.truncate(size)
+        with mmap.mmap(g.fileno(), size) as out:
+            pos = 0
+            for decompressed in decode(_mapped_chunks(text, f.tell()), size):
+                out[pos:pos + len(decompressed)] = decompressed
+                pos += len(decompressed)
+
+
+def _read_block_index(f: BinaryIO) -> list[tuple[int, int]]:
+    """ Return the (compressed size, original size) pairs of the blocks of
+    the BLOCKS file <f>, from the index at the end of the file. <f> is left
+    where it was.
+    """
+    start = f.tell()
+    f.seek(-4, os.SEEK_END)
+    num_blocks = bytes_to_int(f.read(4))
+    f.seek(-4 - 8 * num_blocks, os.SEEK_END)
+    index = f.read(8 * num_blocks)
+    f.seek(start)
+    return [(bytes_to_int(index[i:i + 4]), bytes_to_int(index[i + 4:i + 8]))
+            for i in range(0, len(index), 8)]
+
+
+def _read_blocks(f: BinaryIO) -> Iterator[bytes]:
+    """ Yield the compressed blocks of the BLOCKS file <f> one at a time,
+    using the index at the end of the file to find them.
+
+    Precondition: <f> is positioned just after the two bytes that mark the
+    format.
+    """
+    for compressed_size, _ in _read_block_index(f):
+        yield f.read(compressed_size)
+
+
+def _decompress_block(compressed: bytes) -> bytes:
+    """ Return the decompressed form of the block <compressed>, as returned
+    by _compress_block.
+    """
+    if compressed[0] == 0:
+        if compressed[1] == BLOCK_RAW:
+            return compressed[2:]
+        if compressed[1] == BLOCK_RLE:
+            return run_length_decode(compressed[6:])
+        raise ValueError(f"unknown block format {compressed[1]}")
+    num_nodes = compressed[0]
+    node_lst = bytes_to_nodes(compressed[1:1 + num_nodes * 4])
+    tree = generate_tree_general(node_lst, num_nodes - 1)
+    return decompress_bytes(tree, compressed[5 + num_nodes * 4:],
+                            _block_size(compressed))
 
 
 def improve_tree(tree: HuffmanTree, freq_dict: dict[int, int]) -> None:
@@ -436,34 +2841,20 @@ def improve_tree(tree: HuffmanTree, freq_dict: dict[int, int]) -> None:
     >>> avg_length(tree, freq)
     2.31
     """
-
-    def _improve_tree_insertion(t: HuffmanTree, ls: list, index: int) -> int:
-        """
-        improve_tree_insertion
-        """
-        if t.is_leaf():
-            t.symbol = ls[index]
-            return index + 1
-        else:
-            index = _improve_tree_insertion(t.left, ls, index)
-            index = _improve_tree_insertion(t.right, ls, index)
-            return index
-
-    def _improve_tree_leaves(t: HuffmanTree) -> list:
-        """
-        improve_tree_leaves
-        """
-        if t.is_leaf():
-            return [t.symbol]
+    # the leaves from left to right, found with a stack instead of recursion
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.is_leaf():
+            nodes.append(node)
         else:
-            result = []
-            result.extend(_improve_tree_leaves(t.left))
-            result.extend(_improve_tree_leaves(t.right))
-            return result
-
-    leaves = _improve_tree_leaves(tree)
+            stack.append(node.right)
+            stack.append(node.left)
+    leaves = [node.symbol for node in nodes]
     leaves.sort(key=lambda x: freq_dict[x], reverse=True)
-    _improve_tree_insertion(tree, leaves, 0)
+    for node, symbol in zip(nodes, leaves):
+        node.symbol = symbol
 
 
 if __name__ == "__main__":
@@ -475,10 +2866,18 @@ if __name__ == "__main__":
     import python_ta
 
     python_ta.check_all(config={
-        'allowed-io': ['compress_file', 'decompress_file'],
+        'allowed-io': ['compress_file', 'decompress_file', '_count_range',
+                       '_compress_blocks', '_compress_mapped',
+                       '_decompress_mapped', 'decompress_range',
+                       'train_dictionary', 'load_dictionary',
+                       '_compress_digrams', '_compress_context_file',
+                       '_compress_lz77_file', '_compress_filtered'],
         'allowed-import-modules': [
-            'python_ta', 'doctest', 'typing', '__future__',
-            'time', 'utils', 'huffman', 'random'
+            'python_ta', 'doctest', 'typing', '__future__', 'binascii',
+            'collections',
+            'concurrent.futures', 'contextlib', 'functools', 'heapq', 'io',
+            'mmap', 'numpy', 'os', 're', 'time', 'utils', 'huffman',
+            'adaptive', 'bwt', 'filters', 'lz77', 'random'
         ],
         'disable': ['W0401']
     })
@@ -0,0 +1,191 @@
+"""
+Prediction filters, as in PNG, for CSC148 Assignment 2.
+
+Each filter replaces a byte with its difference from a prediction made from
+the bytes before it, the byte a row above it, or both. Pixels of a smooth
+image then become small numbers that repeat, which a Huffman code stores in
+fewer bits than the pixels themselves. choose_filters picks a filter for
+each block of the input, and bitmap_layout finds the rows and pixels of a
+BMP image so that the filters can look up a row.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+from utils import bytes_to_int
+
+# number of bytes in each block that gets a filter of its own
+FILTER_BLOCK_SIZE = 1 << 15
+
+# the most bytes a filter looks back within a row
+FILTER_MAX_STRIDE = 4
+
+# the filters, by number, as in PNG. Each predicts a byte from the byte
+# <stride> before it, the byte a row before it, and the byte a row and
+# <stride> before it
+FILTERS = [lambda left, up, upper_left: 0,
+           lambda left, up, upper_left: left,
+           lambda left, up, upper_left: up,
+           lambda left, up, upper_left: (left + up) >> 1,
+           lambda left, up, upper_left: _paeth(left, up, upper_left)]
+FILTER_NONE = 0
+FILTER_SUB = 1
+FILTER_UP = 2
+FILTER_AVERAGE = 3
+FILTER_PAETH = 4
+
+# the sizes of the DIB headers of BMP images that bitmap_layout reads,
+# which all hold the width in 4 bytes and the bit depth at byte 28
+BMP_HEADER_SIZES = (40, 52, 56, 108, 124)
+
+# the bit depths a BMP image can have
+BMP_BIT_DEPTHS = (1, 4, 8, 16, 24, 32)
+
+
+def _paeth(left: int, up: int, upper_left: int) -> int:
+    """ Return whichever of <left>, <up> and <upper_left> is closest to
+    left + up - upper_left, in that order when they tie, as in PNG.
+
+    >>> _paeth(10, 20, 10), _paeth(20, 10, 10), _paeth(3, 9, 6)
+    (20, 20, 6)
+    """
+    guess = left + up - upper_left
+    to_left, to_up = abs(guess - left), abs(guess - up)
+    to_upper_left = abs(guess - upper_left)
+    if to_left <= to_up and to_left <= to_upper_left:
+        return left
+    return up if to_up <= to_upper_left else upper_left
+
+
+def bitmap_layout(text: bytes) -> tuple[int, int]:
+    """ Return the number of bytes per pixel and per row of the pixels in
+    <text>, if it is a BMP image, or (0, 0) if it is not.
+
+    The header is only trusted if its DIB header is one of the sizes in
+    BMP_HEADER_SIZES, its bit depth is one of BMP_BIT_DEPTHS, and the rows
+    it describes fit in <text>.
+
+    >>> header = (b"BM" + bytes(12) + (40).to_bytes(4, "little")
+    ...           + (5).to_bytes(4, "little") + (2).to_bytes(4, "little")
+    ...           + bytes(2) + (24).to_bytes(2, "little"))
+    >>> bitmap_layout(header + bytes(24))
+    (3, 16)
+    >>> bitmap_layout(header)
+    (0, 0)
+    >>> bitmap_layout(b"BMW is a car brand from Munich, founded in 1916.")
+    (0, 0)
+    >>> bitmap_layout(b"helloworld")
+    (0, 0)
+    """
+    if len(text) < 30 or text[:2] != b"BM" \
+            or bytes_to_int(text[14:18]) not in BMP_HEADER_SIZES:
+        return 0, 0
+    width = abs(int.from_bytes(text[18:22], "little", signed=True))
+    height = abs(int.from_bytes(text[22:26], "little", signed=True))
+    bits = bytes_to_int(text[28:30])
+    # each row is padded to a multiple of 4 bytes
+    row = (width * bits + 31) // 32 * 4
+    if bits not in BMP_BIT_DEPTHS or row == 0 or row * height > len(text):
+        return 0, 0
+    return min(max(bits // 8, 1), FILTER_MAX_STRIDE), row
+
+
+def _filter_choices(stride: int, row: int) -> list[int]:
+    """ Return the choices of filter and stride tried on each block by
+    choose_filters, as filter << 4 | stride, for pixels of <stride> bytes
+    in rows of <row> bytes, or for data with no rows if <row> is 0.
+
+    >>> [hex(choice) for choice in _filter_choices(0, 0)]
+    ['0x0', '0x11', '0x12', '0x13', '0x14']
+    >>> [hex(choice) for choice in _filter_choices(3, 1800)][5:]
+    ['0x23', '0x33', '0x43']
+    """
+    choices = [FILTER_NONE << 4] + [FILTER_SUB << 4 | step for step
+                                    in range(1, FILTER_MAX_STRIDE + 1)]
+    if row:
+        choices += [FILTER_UP << 4 | stride, FILTER_AVERAGE << 4 | stride,
+                    FILTER_PAETH << 4 | stride]
+    return choices
+
+
+def _apply_filter(buf: bytes, context: int, choice: int, row: int) -> bytes:
+    """ Return the bytes of <buf> after the first <context>, each minus its
+    prediction by the filter and stride in <choice>, modulo 256. The first
+    <context> bytes are the ones before the block, or zeros at the start.
+
+    >>> list(_apply_filter(bytes([0, 5, 7, 7, 10]), 1, FILTER_SUB << 4 | 1,
+    ...                    0))
+    [5, 2, 0, 3]
+    """
+    predict = FILTERS[choice >> 4]
+    stride = choice & 15
+    end = len(buf)
+    return bytes([(byte - predict(left, up, upper_left)) & 0xFF
+                  for byte, left, up, upper_left in
+                  zip(buf[context:], buf[context - stride:end - stride],
+                      buf[context - row:end - row],
+                      buf[context - row - stride:end - row - stride])])
+
+
+def undo_filter(buf: bytearray, context: int, choice: int,
+                 row: int) -> None:
+    """ Replace the bytes of <buf> after the first <context> with the bytes
+    that _apply_filter turned into them, front to back, since each
+    prediction needs the bytes before it.
+
+    >>> buf = bytearray([0, 5, 2, 0, 3])
+    >>> undo_filter(buf, 1, FILTER_SUB << 4 | 1, 0)
+    >>> list(buf)
+    [0, 5, 7, 7, 10]
+    """
+    predict = FILTERS[choice >> 4]
+    stride = choice & 15
+    for i in range(context, len(buf)):
+        buf[i] = (buf[i] + predict(buf[i - stride], buf[i - row],
+                                   buf[i - row - stride])) & 0xFF
+
+
+def choose_filters(text: bytes, stride: int, row: int,
+                   cost: Callable[[bytes], float]) -> tuple[bytes, bytes]:
+    """ Return <text> with each block of FILTER_BLOCK_SIZE bytes filtered by
+    the filter that gives the smallest <cost>, and the choice of filter and
+    stride for each block, as in _filter_choices for pixels of <stride>
+    bytes in rows of <row> bytes.
+
+    The predictions look back across blocks, and before the start of
+    <text> every byte counts as 0.
+
+    >>> filtered, choices = choose_filters(bytes(range(100)), 0, 0,
+    ...                                    lambda block: len(set(block)))
+    >>> list(filtered[:5]), list(choices)
+    ([0, 1, 1, 1, 1], [17])
+    """
+    context = row + FILTER_MAX_STRIDE
+    result = []
+    choices = bytearray()
+    for start in range(0, len(text), FILTER_BLOCK_SIZE):
+        buf = (bytes(max(context - start, 0))
+               + text[max(start - context, 0):start + FILTER_BLOCK_SIZE])
+        best = None
+        for choice in _filter_choices(stride, row):
+            filtered = _apply_filter(buf, context, choice, row)
+            size = cost(filtered)
+            if best is None or size < best[0]:
+                best = size, choice, filtered
+        result.append(best[2])
+        choices.append(best[1])
+    return b"".join(result), bytes(choices)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'doctest', '__future__', 'typing', 'utils'
+        ]
+    })
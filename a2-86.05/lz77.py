@@ -0,0 +1,183 @@
+"""
+LZ77 match finding, as in deflate, for CSC148 Assignment 2.
+
+lz77_tokens replaces the bytes of its input with literals and with matches
+that copy bytes from up to LZ77_WINDOW bytes back. Runs and repeated
+strings then cost a few bits each, which a Huffman code over single bytes
+cannot do. compress.py codes the tokens of each block with Huffman codes of
+its own, using lz77_bucket to split their lengths and distances into codes
+and extra bits.
+"""
+from __future__ import annotations
+
+from typing import Union
+
+# how far back a match of lz77_tokens can start, and its shortest and
+# longest length, as in deflate
+LZ77_WINDOW = 1 << 15
+LZ77_MIN_MATCH = 3
+LZ77_MAX_MATCH = 258
+
+# the (max_chain, nice_length, lazy) settings of each level of lz77_tokens:
+# how many earlier positions are tried for a match, the length that is good
+# enough to stop trying, and whether the next position is tried as well
+# before a match is taken. Level 0 is not used
+LZ77_LEVELS = [(0, 0, False), (4, 8, False), (8, 16, False),
+               (32, 32, False), (16, 16, True), (32, 32, True),
+               (128, 128, True), (256, 128, True), (1024, 258, True),
+               (4096, 258, True)]
+
+# the number of codes lz77_bucket gives the lengths of matches, less
+# LZ77_MIN_MATCH, and their distances, less 1
+LZ77_LENGTH_CODES = 16
+LZ77_DISTANCE_CODES = 30
+
+
+def lz77_tokens(text: bytes, level: int = 6, start: int = 0) \
+        -> list[Union[int, tuple[int, int]]]:
+    """ Return <text> from <start> on as a list of literals, which are
+    bytes, and matches, which are (length, distance) pairs that stand for
+    the <length> bytes starting <distance> bytes back. A match can start in
+    the bytes before <start>. <level> is from 1, fastest, to 9, the most
+    matches found, as set out in LZ77_LEVELS.
+
+    Earlier positions are found by a hash of the 3 bytes that start there,
+    and each position links to the one before it with the same hash, as
+    in zlib. Only the last LZ77_WINDOW positions are kept, in a list of
+    that size.
+
+    >>> lz77_tokens(b"abcabcabcd")
+    [97, 98, 99, (6, 3), 100]
+    >>> lz77_tokens(b"aaaaa", 1)
+    [97, (4, 1)]
+    >>> lz77_tokens(b"abcdabcd", 6, 4)
+    [(4, 4)]
+    >>> lz77_tokens(b"aaaaa", 10)
+    Traceback (most recent call last):
+    ...
+    ValueError: LZ77 level 10 is not from 1 to 9
+    """
+    if not 1 <= level < len(LZ77_LEVELS):
+        raise ValueError(f"LZ77 level {level} is not from 1 to "
+                         f"{len(LZ77_LEVELS) - 1}")
+    max_chain, nice_length, lazy = LZ77_LEVELS[level]
+    size = len(text)
+    mask = LZ77_WINDOW - 1
+    head = [-1] * LZ77_WINDOW
+    previous = [-1] * LZ77_WINDOW
+
+    def _hash(i: int) -> int:
+        """ Return the hash of the 3 bytes of <text> at <i>."""
+        return ((text[i] << 10) ^ (text[i + 1] << 5) ^ text[i + 2]) & mask
+
+    def _insert(i: int) -> None:
+        """ Make <i> the latest position with its hash."""
+        if i + LZ77_MIN_MATCH <= size:
+            h = _hash(i)
+            previous[i & mask] = head[h]
+            head[h] = i
+
+    def _find(i: int) -> tuple[int, int]:
+        """ Return the (length, distance) of the longest match at <i>, or
+        (0, 0) if there is none.
+        """
+        limit = min(LZ77_MAX_MATCH, size - i)
+        if limit < LZ77_MIN_MATCH:
+            return 0, 0
+        best, distance = LZ77_MIN_MATCH - 1, 0
+        candidate = head[_hash(i)]
+        chain = max_chain
+        # positions older than the window may have been overwritten
+        while candidate >= 0 and i - candidate < LZ77_WINDOW and chain:
+            chain -= 1
+            if text[candidate + best] == text[i + best]:
+                length = _match_length(text, candidate, i, limit)
+                if length > best:
+                    best, distance = length, i - candidate
+                    if length >= nice_length or length == limit:
+                        break
+            candidate = previous[candidate & mask]
+        return (best, distance) if distance else (0, 0)
+
+    for i in range(max(start - LZ77_WINDOW, 0), start):
+        _insert(i)
+    tokens = []
+    i = start
+    match = None
+    while i < size:
+        if match is None:
+            match = _find(i)
+            _insert(i)
+        length, distance = match
+        match = None
+        if length == 0:
+            tokens.append(text[i])
+            i += 1
+            continue
+        if lazy and length < nice_length:
+            match = _find(i + 1)
+            _insert(i + 1)
+            if match[0] > length:
+                # the match at the next byte is better, so this byte is sent
+                # as a literal, and that match is taken next time
+                tokens.append(text[i])
+                i += 1
+                continue
+            match = None
+            start = i + 2
+        else:
+            start = i + 1
+        tokens.append((length, distance))
+        for j in range(start, i + length):
+            _insert(j)
+        i += length
+    return tokens
+
+
+def _match_length(text: bytes, earlier: int, i: int, limit: int) -> int:
+    """ Return how many bytes of <text> from <earlier> match the ones from
+    <i>, up to <limit>. The bytes are compared 8 at a time, and only the
+    last few of them one at a time.
+
+    >>> _match_length(b"abcdabcx", 0, 4, 4)
+    3
+    """
+    length = 0
+    while length < limit:
+        end = min(length + 8, limit)
+        if text[earlier + length:earlier + end] != text[i + length:i + end]:
+            while text[earlier + length] == text[i + length]:
+                length += 1
+            return length
+        length = end
+    return length
+
+
+def lz77_bucket(value: int) -> tuple[int, int, int]:
+    """ Return the code of <value>, the number of extra bits after it and
+    those bits, as deflate does for distances: 0 to 3 get codes of their
+    own, and every range from one power of 2 to the next is split in two
+    codes, with the rest of the value in the extra bits.
+
+    >>> lz77_bucket(2), lz77_bucket(5), lz77_bucket(255)
+    ((2, 0, 0), (4, 1, 1), (15, 6, 63))
+    """
+    if value < 4:
+        return value, 0, 0
+    extra = value.bit_length() - 2
+    return 2 * extra + 2 + (value >> extra & 1), extra, \
+        value & ((1 << extra) - 1)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'doctest', '__future__', 'typing'
+        ]
+    })